@@ -0,0 +1,141 @@
+import os, json, struct, hashlib, functools;
+from concurrent.futures import ThreadPoolExecutor;
+import pygame;
+
+"""Loads the game's images into one atlas (cached on disk) and caches fonts and rendered text."""
+
+
+HERE = os.path.dirname(os.path.abspath(__file__));
+IMAGE_DIR = os.path.join(HERE, "IMAGES");
+CACHE_DIR = os.path.join(HERE, "__assetcache__");
+
+MAGIC = b"TDAT";
+VERSION = 1;
+HEADER = struct.Struct("<4sB16sIII"); # magic, version, key, atlas width, atlas height, layout length
+PADDING = 1; # empty pixels between sprites in the atlas
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(name, size):
+    """ SysFont looks through every font on the system, so only do it once per font
+
+    The fonts die with pygame.quit, so the first one cached after a quit (or at the start)
+    also asks pygame to forget them all at the next quit.
+    """
+    if not get_font.cache_info().currsize:
+        pygame.register_quit(forget);
+    return pygame.font.SysFont(name, size);
+
+
+@functools.lru_cache(maxsize=1024)
+def render_text(name, size, text, color, antialias=True):
+    """ rendered text, shared by everything that draws the same words the same way """
+    return get_font(name, size).render(text, antialias, color);
+
+
+def forget():
+    """ drop every cached font and rendered text, they can't be used once pygame quits """
+    get_font.cache_clear();
+    render_text.cache_clear();
+
+
+def pack(sizes, max_width=1024):
+    """ shelf-pack (name, (width, height)) pairs, tallest first; returns positions and the atlas size """
+    positions = {};
+    x = y = shelf = width = 0;
+    for name, (w, h) in sorted(sizes, key=lambda item: (-item[1][1], item[0])):
+        if x and x + w > max_width:
+            x, y, shelf = 0, y + shelf + PADDING, 0;
+        positions[name] = (x, y);
+        x += w + PADDING;
+        shelf = max(shelf, h);
+        width = max(width, x);
+    return positions, (max(width, 1), max(y + shelf, 1));
+
+
+class AssetManager():
+
+    """ decodes images in parallel, packs them into one atlas and keeps a converted copy on disk """
+
+    def __init__(self, folder=IMAGE_DIR, cache_dir=CACHE_DIR, workers=4):
+        self.folder = folder;
+        self.cache_dir = cache_dir; # None turns the disk cache off
+        self.workers = workers;
+        self.atlas = None;
+        self.images = {};
+        self.from_cache = False;
+
+    def key(self, files):
+        """ changes whenever any of the source images does """
+        h = hashlib.blake2b(digest_size=16);
+        for name, file in sorted(files.items()):
+            info = os.stat(os.path.join(self.folder, file));
+            h.update("{}={}:{}:{};".format(name, file, info.st_mtime_ns, info.st_size).encode());
+        return h.digest();
+
+    def cache_file(self):
+        return os.path.join(self.cache_dir, "atlas.bin");
+
+    def read_cache(self, key):
+        """ the atlas and its layout from disk, or None if it's missing or out of date """
+        if not self.cache_dir: return None;
+        try:
+            with open(self.cache_file(), "rb") as f:
+                magic, version, cached_key, width, height, length = HEADER.unpack(f.read(HEADER.size));
+                if magic != MAGIC or version != VERSION or cached_key != key: return None;
+                layout = json.loads(f.read(length).decode());
+                pixels = f.read(width * height * 4);
+        except (OSError, ValueError, struct.error):
+            return None;
+        if len(pixels) != width * height * 4: return None;
+        return pygame.image.frombytes(pixels, (width, height), "RGBA"), layout;
+
+    def write_cache(self, key, atlas, layout):
+        if not self.cache_dir: return;
+        data = json.dumps(layout).encode();
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True);
+            with open(self.cache_file(), "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, key, atlas.get_width(), atlas.get_height(), len(data)));
+                f.write(data);
+                f.write(pygame.image.tobytes(atlas, "RGBA"));
+        except OSError:
+            pass; # a read-only install just decodes every time
+
+    def decode(self, files):
+        """ load every file on a thread pool """
+        paths = {name: os.path.join(self.folder, file) for name, file in files.items()};
+        with ThreadPoolExecutor(self.workers) as pool:
+            surfaces = dict(zip(paths, pool.map(pygame.image.load, paths.values())));
+        return surfaces;
+
+    def build(self, surfaces):
+        """ pack decoded surfaces into one SRCALPHA atlas """
+        positions, size = pack([(name, surface.get_size()) for name, surface in surfaces.items()]);
+        atlas = pygame.Surface(size, pygame.SRCALPHA, 32);
+        layout = {};
+        for name, surface in surfaces.items():
+            x, y = positions[name];
+            atlas.blit(surface, (x, y));
+            layout[name] = (x, y) + surface.get_size();
+        return atlas, layout;
+
+    def load(self, files, opaque=()):
+        """ {name: file in the image folder} -> {name: subsurface of the atlas}; needs a display mode set
+
+        Names in opaque get their own surface without per-pixel alpha, like Surface.convert gives.
+        """
+        key = self.key(files);
+        cached = self.read_cache(key);
+        self.from_cache = cached is not None;
+        if cached:
+            atlas, layout = cached;
+        else:
+            atlas, layout = self.build(self.decode(files));
+            self.write_cache(key, atlas, layout);
+
+        self.atlas = atlas.convert_alpha();
+        self.images = {name: self.atlas.subsurface(rect) for name, rect in layout.items()};
+        for name in opaque:
+            self.images[name] = self.images[name].convert();
+        return self.images;
@@ -0,0 +1,160 @@
+import os, sys, glob, json, time, argparse, platform, traceback;
+from concurrent.futures import ProcessPoolExecutor, as_completed;
+
+"""Runs many headless games at once, one per CPU core, and collects the results in one report."""
+
+
+HERE = os.path.dirname(os.path.abspath(__file__));
+SCRIPTS = ("patrol", "idle");
+
+Environment = None; # loaded once in each worker process
+
+
+def start_worker():
+    """ set up a worker process: no window, and the game loaded once for every run it does """
+    global Environment;
+    os.environ["SDL_VIDEODRIVER"] = "dummy";
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1");
+    sys.path.insert(0, HERE);
+    from Benchmark import load_environment;
+    Environment = load_environment();
+
+
+def run(job):
+    """ one headless game, returning its final stats and how long it took """
+    from Benchmark import patrol;
+    from Replay import Replayer;
+    result = dict(job, pid=os.getpid());
+    start = time.perf_counter();
+    cpu = time.process_time();
+    try:
+        env = Environment(headless=True, seed=job.get("seed"));
+        env.enemy_engine = job["engine"];
+        env.lod = job["lod"];
+        if job.get("replay"):
+            replayer = Replayer.load(job["replay"]);
+            result["scene"], result["seed"] = replayer.scene, replayer.seed;
+            stats = replayer.replay(env);
+            result["lod"] = env.lod; # the recording's own setting wins
+        else:
+            controller = None;
+            if job["script"] == "patrol":
+                inputs = patrol(job["ticks"]);
+                controller = lambda env, tick: inputs[tick];
+            stats = env.simulate(job["scene"], job["ticks"], controller);
+        result.update(stats);
+    except Exception as e:
+        result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip();
+    result["seconds"] = round(time.perf_counter() - start, 4);
+    result["cpu_seconds"] = round(time.process_time() - cpu, 4);
+    return result;
+
+
+def parse_seeds(text):
+    """ "5" is seeds 0-4, "3-7" is 3 to 7, "1,4,9" is just those """
+    if "," in text:
+        return [int(seed) for seed in text.split(",")];
+    if "-" in text:
+        first, last = (int(n) for n in text.split("-"));
+        return list(range(first, last + 1));
+    return list(range(int(text)));
+
+
+def make_jobs(scenes, seeds, scripts, replays, ticks, engine="sprites", lod=False):
+    """ every scene with every seed and input script, plus every replay """
+    jobs = [{"scene": scene, "seed": seed, "script": script, "ticks": ticks, "engine": engine, "lod": lod}
+            for scene in scenes for seed in seeds for script in scripts];
+    jobs += [{"replay": path, "engine": engine, "lod": lod} for path in replays];
+    for n, job in enumerate(jobs):
+        job["id"] = n;
+    return jobs;
+
+
+def summarize(results):
+    """ per scene and script: how many runs, how many finished or failed, and the average stats """
+    groups = {};
+    for result in results:
+        key = "{} ({})".format(result.get("scene"), result.get("script", "replay"));
+        groups.setdefault(key, []).append(result);
+    summary = {};
+    for key, runs in sorted(groups.items()):
+        good = [run for run in runs if "error" not in run];
+        summary[key] = {
+            "runs": len(runs),
+            "errors": len(runs) - len(good),
+            "finished": sum(1 for run in good if run.get("finished")),
+            "mean_xp": round(sum(run["xp"] for run in good) / len(good), 2) if good else None,
+            "mean_level": round(sum(run["level"] for run in good) / len(good), 2) if good else None,
+            "mean_gems": round(sum(run["gems"] for run in good) / len(good), 2) if good else None,
+            "mean_seconds": round(sum(run["seconds"] for run in runs) / len(runs), 4),
+        };
+    return summary;
+
+
+def run_batch(jobs, workers=None, progress=None):
+    """ fan the jobs out over a process pool, returning the results in job order and the wall time """
+    workers = workers or os.cpu_count() or 1;
+    results = [];
+    start = time.perf_counter();
+    with ProcessPoolExecutor(workers, initializer=start_worker) as pool:
+        futures = [pool.submit(run, job) for job in jobs];
+        for future in as_completed(futures):
+            result = future.result();
+            results.append(result);
+            if progress: progress(result, len(results), len(jobs));
+    wall = time.perf_counter() - start;
+    results.sort(key=lambda result: result["id"]);
+    return results, wall;
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run lots of headless games in parallel and report the results");
+    parser.add_argument("scenes", nargs="*", help="scene files (default: everything in scenes/)");
+    parser.add_argument("--seeds", default="10", help="N for seeds 0 to N-1, A-B for a range or a comma separated list");
+    parser.add_argument("--script", action="append", choices=SCRIPTS,
+                        help="scripted input to play each scene with, can be given more than once (default: patrol)");
+    parser.add_argument("--replay", action="append", default=[], help="also run a recording from Replay.py");
+    parser.add_argument("--ticks", type=int, default=3000, help="longest a scripted run goes on for");
+    parser.add_argument("--engine", choices=("sprites", "numpy"), default="sprites", help="how the bananas are moved");
+    parser.add_argument("--lod", action="store_true", help="update bananas far off screen less often");
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per CPU)");
+    parser.add_argument("--output", default="batch_results.json", help="where to write the JSON report");
+    parser.add_argument("--quiet", action="store_true", help="don't print each run as it finishes");
+    args = parser.parse_args(argv);
+
+    scenes = args.scenes or sorted(glob.glob(os.path.join(HERE, "scenes", "*.txt")));
+    jobs = make_jobs(scenes, parse_seeds(args.seeds), args.script or ["patrol"], args.replay, args.ticks,
+                     args.engine, args.lod);
+    workers = args.workers or os.cpu_count() or 1;
+
+    def progress(result, done, total):
+        if args.quiet: return;
+        outcome = result.get("error") or "xp {xp} level {level} gems {gems}".format(**result);
+        print("[{}/{}] {} seed {}: {} ({} s)".format(done, total, result.get("scene") or result.get("replay"),
+                                                      result.get("seed"), outcome, result["seconds"]));
+
+    results, wall = run_batch(jobs, workers, progress);
+    busy = sum(result["cpu_seconds"] for result in results);
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "workers": workers,
+        "runs": len(results),
+        "errors": sum(1 for result in results if "error" in result),
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(busy, 3), # CPU time of all the runs added up
+        "speedup": round(busy / wall, 2) if wall else None, # how many cores were kept busy on average
+        "summary": summarize(results),
+        "results": results,
+    };
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2);
+    print("{runs} runs ({errors} failed) on {workers} workers in {wall_seconds} s, "
+          "{cpu_seconds} s of CPU time ({speedup}x) -> {output}".format(output=args.output, **report));
+    return report;
+
+
+if __name__ == "__main__":
+    main();
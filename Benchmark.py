@@ -0,0 +1,244 @@
+import os, sys, json, time, random, argparse, platform, tempfile, subprocess, importlib.util;
+import pygame;
+
+try:
+    import resource;
+except ImportError:
+    resource = None; # not on Windows, memory numbers are skipped there
+
+"""Generates synthetic scenes, runs them headless and reports how fast the game loop is."""
+
+
+HERE = os.path.dirname(os.path.abspath(__file__));
+
+PRESETS = {
+    # columns, rows, wall density, enemy density, gem density
+    "small": (50, 40, 0.05, 0.01, 0.01),
+    "medium": (100, 100, 0.08, 0.02, 0.01),
+    "large": (250, 250, 0.08, 0.02, 0.01),
+};
+
+
+def load_environment():
+    """ the Environment class lives in __main__.py, which can't be imported by name """
+    spec = importlib.util.spec_from_file_location("game", os.path.join(HERE, "__main__.py"));
+    game = importlib.util.module_from_spec(spec);
+    spec.loader.exec_module(game);
+    return game.Environment;
+
+
+def generate_scene(columns, rows, walls=0.05, enemies=0.01, gems=0.01, seed=0):
+    """ a random scene in the load_scene text format, with a gun next to the player's start """
+    rng = random.Random(seed);
+    lines = ["H" * columns];
+    for row in range(1, rows - 1):
+        line = ["V"];
+        for col in range(1, columns - 1):
+            roll = rng.random();
+            if 2 <= col <= 5 and 2 <= row <= 5:
+                line.append("0"); # keep the spawn point clear
+            elif roll < walls:
+                line.append(rng.choice("HV"));
+            elif roll < walls + enemies:
+                line.append("E");
+            elif roll < walls + enemies + gems:
+                line.append("G");
+            else:
+                line.append("0");
+        line.append("V");
+        lines.append("".join(line));
+    lines.append("H" * columns);
+    lines[3] = lines[3][:3] + "S" + lines[3][4:]; # the player starts on top of this
+    return "\n".join(lines) + "\n";
+
+
+def patrol(ticks, width=800, height=600):
+    """ scripted input that keeps the player moving around and shooting """
+    points = [(width - 50, height // 2), (width // 2, height - 50), (50, height // 2), (width // 2, 50),
+              (width - 50, height - 50), (50, 50)];
+    return [(points[(tick // 45) % len(points)], tick % 100 < 80, True) for tick in range(ticks)];
+
+
+def percentile(values, p):
+    values = sorted(values);
+    if not values: return 0.0;
+    return values[int(round(p / 100 * (len(values) - 1)))];
+
+
+def summarize(samples):
+    """ p50 / p99 of a list of timings in seconds, reported in milliseconds """
+    return {"p50_ms": round(percentile(samples, 50) * 1000, 4), "p99_ms": round(percentile(samples, 99) * 1000, 4)};
+
+
+def run_case(Environment, name, scene, ticks, render=True, seed=0, engine="sprites", stream=False, lod=False,
+             pipelined=False):
+    """ run one scene for a fixed number of ticks, timing update and render separately
+
+    With pipelined the render time is only what the main thread spent on it, the blits
+    and flips happen alongside; ticks_per_s counts until the last frame is on screen.
+    """
+    env = Environment(headless=True, seed=seed);
+    env.enemy_engine = engine;
+    env.streaming = stream;
+    env.lod = lod;
+    env.pipelined = pipelined;
+    env.setup(scene);
+    inputs = patrol(ticks);
+    update_times, render_times, frame_times = [], [], [];
+    clock = time.perf_counter;
+
+    start = clock();
+    for tick in range(ticks):
+        if not env.running: break;
+        mouse_pos, env.player.moving, env.player.shooting = inputs[tick];
+        t0 = clock();
+        env.step(mouse_pos);
+        t1 = clock();
+        if render:
+            env.render(mouse_pos);
+        t2 = clock();
+        update_times.append(t1 - t0);
+        render_times.append(t2 - t1);
+        frame_times.append(t2 - t0);
+    env.renderer.finish();
+    elapsed = clock() - start;
+    env.renderer.close();
+
+    return {
+        "name": name,
+        "engine": engine,
+        "stream": stream,
+        "lod": lod,
+        "pipelined": pipelined,
+        "ticks": len(frame_times),
+        "seconds": round(elapsed, 4),
+        "ticks_per_s": round(len(frame_times) / elapsed, 2) if elapsed else 0.0,
+        "frame": summarize(frame_times),
+        "update": summarize(update_times),
+        "render": summarize(render_times),
+        "enemies_left": len(env.enemies),
+        "bullets_live": len(env.player.bullets),
+        "player": env.stats(),
+        "lod_overruns": env.scheduler.overruns if env.scheduler else None,
+        "render_waits": env.renderer.waits if pipelined else None,
+        "peak_rss_kb": peak_rss(),
+    };
+
+
+def peak_rss():
+    """ peak resident set size of this process in KiB, or None where it can't be measured """
+    if resource is None: return None;
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss;
+    return peak // 1024 if sys.platform == "darwin" else peak; # macOS reports bytes
+
+
+def load_only(scene, stream=False):
+    """ load a scene in this (fresh) process and print how much the peak RSS grew """
+    Environment = load_environment();
+    env = Environment(headless=True, seed=0);
+    env.streaming = stream;
+    pygame.init();
+    pygame.display.set_mode((800, 600));
+    before = peak_rss();
+    env.setup(scene);
+    after = peak_rss();
+    print(json.dumps({"scene": scene, "baseline_kb": before, "peak_kb": after,
+                      "scene_kb": after - before if before is not None else None}));
+
+
+def memory_report(scenes, stream=False):
+    """ peak RSS for loading each scene, every one in its own process """
+    results = [];
+    for name, path in scenes:
+        env = dict(os.environ, SDL_VIDEODRIVER="dummy");
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--load-only", path] + ["--stream"] * stream,
+                             capture_output=True, text=True, env=env, check=True).stdout;
+        result = json.loads(out.strip().splitlines()[-1]);
+        result["name"] = name;
+        results.append(result);
+        print("{name:>12}: peak {peak_kb} KiB, {scene_kb} KiB for the scene".format(**result));
+    return results;
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the game loop on generated scenes");
+    parser.add_argument("--preset", action="append", choices=sorted(PRESETS),
+                        help="scene size to run, can be given more than once (default: all)");
+    parser.add_argument("--size", metavar="COLSxROWS", help="run a custom scene size instead of the presets");
+    parser.add_argument("--walls", type=float, default=0.08, help="wall density for --size");
+    parser.add_argument("--enemies", type=float, default=0.02, help="enemy density for --size");
+    parser.add_argument("--gems", type=float, default=0.01, help="gem density for --size");
+    parser.add_argument("--scene", action="append", default=[], help="also run an existing scene file");
+    parser.add_argument("--ticks", type=int, default=1000);
+    parser.add_argument("--seed", type=int, default=0);
+    parser.add_argument("--no-render", action="store_true", help="only time the simulation");
+    parser.add_argument("--engine", choices=("sprites", "numpy"), default="sprites", help="how the bananas are moved");
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results");
+    parser.add_argument("--stream", action="store_true", help="load the scenes in chunks around the camera");
+    parser.add_argument("--lod", action="store_true", help="update bananas far off screen less often");
+    parser.add_argument("--pipelined", action="store_true",
+                        help="run each case again with the render thread and report the speedup");
+    parser.add_argument("--memory", action="store_true", help="report peak RSS of loading each scene instead of timing");
+    parser.add_argument("--load-only", metavar="SCENE", help=argparse.SUPPRESS);
+    args = parser.parse_args(argv);
+
+    if args.load_only:
+        return load_only(args.load_only, args.stream);
+
+    if args.size:
+        columns, rows = (int(n) for n in args.size.lower().split("x"));
+        cases = {args.size: (columns, rows, args.walls, args.enemies, args.gems)};
+    else:
+        cases = {name: PRESETS[name] for name in (args.preset or sorted(PRESETS))};
+
+    Environment = load_environment();
+    results = [];
+    with tempfile.TemporaryDirectory() as folder:
+        scenes = [];
+        for name, (columns, rows, walls, enemies, gems) in cases.items():
+            path = os.path.join(folder, name + ".txt");
+            with open(path, "w") as f:
+                f.write(generate_scene(columns, rows, walls, enemies, gems, args.seed));
+            scenes.append((name, path));
+        scenes += [(os.path.basename(path), path) for path in args.scene];
+
+        if args.memory:
+            memory = memory_report(scenes, args.stream);
+            scenes = [];
+
+        for name, path in scenes:
+            for pipelined in (False, True) if args.pipelined else (False,):
+                result = run_case(Environment, name, path, args.ticks, not args.no_render, args.seed, args.engine,
+                                  args.stream, args.lod, pipelined);
+                results.append(result);
+                print("{name:>12}{mode}: {ticks_per_s:>9} ticks/s  frame p50 {frame[p50_ms]} ms p99 {frame[p99_ms]} ms  "
+                      "(update p50 {update[p50_ms]} ms, render p50 {render[p50_ms]} ms)".format(
+                          mode=" (pipelined)" if pipelined else "", **result));
+            if pipelined:
+                serial = results[-2]["ticks_per_s"];
+                result["speedup"] = round(result["ticks_per_s"] / serial, 2) if serial else None;
+                print("{:>12}  pipelined speedup {}x".format("", result["speedup"]));
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "ticks": args.ticks,
+        "seed": args.seed,
+        "render": not args.no_render,
+        "stream": args.stream,
+        "lod": args.lod,
+        "pipelined": args.pipelined,
+        "cpus": os.cpu_count(),
+        "results": results,
+    };
+    if args.memory:
+        report["memory"] = memory;
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2);
+    return report;
+
+
+if __name__ == "__main__":
+    main();
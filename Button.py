@@ -1,4 +1,5 @@
 import pygame;
+from Assets import render_text;
 
 
 class Button(pygame.sprite.Sprite):
@@ -12,7 +13,7 @@ class Button(pygame.sprite.Sprite):
         pygame.sprite.Sprite.__init__(self);
         
         self.text = text;
-        self.font = pygame.font.SysFont(font, font_size).render(text, 1, font_color);
+        self.font = render_text(font, font_size, text, tuple(font_color));
         self.width, self.height = self.get_rect_size(width, height);
         self.image = pygame.Surface((self.width, self.height));
         self.rect = self.image.get_rect();
@@ -35,6 +36,7 @@ class Button(pygame.sprite.Sprite):
         self.text_align = text_align;
         self.text_x, self.text_y = self.handle_text_align();
         self.onclick = onclick;
+        self.shown = None; # what the surface was last drawn with
 
         self.add(*groups);
 
@@ -90,7 +92,10 @@ class Button(pygame.sprite.Sprite):
         return self.rect.collidepoint(pygame.mouse.get_pos());
 
     def display(self):
-        """ draw to the button's surface (not the screen) """
+        """ draw to the button's surface (not the screen), only if something changed since last time """
+        state = (self.color, self.font, self.text_x, self.text_y, self.border_color, self.border_width);
+        if state == self.shown: return;
+        self.shown = state;
         self.image.fill(self.color);
         self.image.blit(self.font, (self.text_x, self.text_y));
         pygame.draw.rect(self.image, self.border_color,
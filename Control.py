@@ -3,38 +3,110 @@ import pygame;
 
 class Camera():
 
-    """ scrolling camera so the world can be bigger than the screen """
+    """ scrolling camera so the world can be bigger than the screen
 
-    def __init__(self, total_width, total_height, viewport_width, viewport_height):
+    left and top are the integer offset from world to screen coordinates. They're worked out
+    once per tick in update and changed in place, along with state and view, and to_screen
+    places a whole layer of sprites at once without making a Rect for any of them.
+    allocations counts the lists and tuples the camera hands out, to keep an eye on that.
+    """
+
+    def __init__(self, total_width, total_height, viewport_width, viewport_height, smoothing=0.0):
+        if not 0 <= smoothing < 1:
+            raise ValueError("smoothing has to be at least 0 and under 1");
         self.state = pygame.Rect(0, 0, total_width, total_height);
         self.t_width, self.t_height = total_width, total_height;
         self.width, self.height = viewport_width, viewport_height;
         self.half_width, self.half_height = self.width // 2, self.height // 2;
+        self.left, self.top = 0, 0;
+        self.view = pygame.Rect(0, 0, viewport_width, viewport_height); # the part of the world on screen
+        self.prev = (0, 0); # where the last tick started, for interpolated drawing
+        self.smoothing = smoothing; # 0 keeps the player centred, closer to 1 follows more lazily
+        self.exact = (0.0, 0.0); # the smoothed offset before rounding, so it can keep closing small gaps
+        self.allocations = 0;
 
-    def new_state(self, rect):
-        """ position the camera around the player """
-        left, top, _, _ = rect;
-        _, _, width, height = self.state;
-        left, top, = self.half_width - left, self.half_height - top;
+    def move_to(self, left, top, prev=None):
+        """ put the camera at an offset (floats are kept, and rounded for drawing), in place """
+        self.exact = (left, top);
+        left, top = round(left), round(top);
+        self.left, self.top = left, top;
+        self.state.x, self.state.y = left, top;
+        self.view.x, self.view.y = -left, -top;
+        if prev is not None:
+            self.prev = prev;
 
-        left = min(0, max(self.width - self.state.width, left));
-        top = min(0, max(self.height - self.state.height, top));
+    def to_screen(self, sprites, offset=None, view=None, alpha=1.0):
+        """ the (image, screen position) blit for a whole batch of sprites, leaving out any that miss view
 
-        return pygame.Rect(left, top, width, height);
+        offset is the camera top left to draw from (this tick's if None) and view the world rect
+        it shows. With alpha under 1, anything with a prev_pos is drawn alpha of the way from
+        there to where it is now.
+        """
+        left, top = offset or (self.left, self.top);
+        if alpha >= 1:
+            if view is None:
+                blits = [(spr.image, (spr.rect.x + left, spr.rect.y + top)) for spr in sprites];
+            else:
+                blits = [(spr.image, (spr.rect.x + left, spr.rect.y + top))
+                         for spr in sprites if view.colliderect(spr.rect)];
+        else:
+            blits = [(spr.image, self.interpolate(spr, alpha, left, top))
+                     for spr in sprites if view is None or view.colliderect(spr.rect)];
+        self.allocations += 2 * len(blits) + 1;
+        return blits;
 
-    def apply(self, target):
-        """ keep the player on screen """
-        return target.rect.move(self.state.topleft);
+    def interpolate(self, spr, alpha, left, top):
+        x, y = spr.rect.topleft;
+        prev = getattr(spr, "prev_pos", None);
+        if prev:
+            x = round(prev[0] + (x - prev[0]) * alpha);
+            y = round(prev[1] + (y - prev[1]) * alpha);
+        return x + left, y + top;
 
     def apply_pos(self, pos):
         """ World Coors -> Screen Coors """
-        return (pos[0] + self.state.left, pos[1] + self.state.top);
+        self.allocations += 1;
+        return (pos[0] + self.left, pos[1] + self.top);
 
     def reverse(self, pos):
         """ Screen Coors -> World Coors """
-        return (pos[0] - self.state.left, pos[1] - self.state.top);
+        self.allocations += 1;
+        return (pos[0] - self.left, pos[1] - self.top);
+
+    def offset(self, alpha=1.0):
+        """ the camera's top left, alpha of the way from the last tick's position to this one's """
+        self.allocations += 1;
+        if alpha >= 1:
+            return self.left, self.top;
+        return (round(self.prev[0] + (self.left - self.prev[0]) * alpha),
+                round(self.prev[1] + (self.top - self.prev[1]) * alpha));
 
     def update(self, target):
         if target == None:
             return;
-        self.state = self.new_state(target.rect);
+        self.prev = (self.left, self.top);
+        self.allocations += 1;
+        x, y = target.rect.x, target.rect.y;
+        left = min(0, max(self.width - self.t_width, self.half_width - x));
+        top = min(0, max(self.height - self.t_height, self.half_height - y));
+        if self.smoothing:
+            # close part of the gap each tick instead of jumping straight there
+            exact_left, exact_top = self.exact;
+            left = exact_left + (left - exact_left) * (1 - self.smoothing);
+            top = exact_top + (top - exact_top) * (1 - self.smoothing);
+        self.move_to(left, top);
+
+
+class ScriptedInput():
+
+    """ plays back a list of (mouse_pos, moving, shooting) inputs, one per tick """
+
+    def __init__(self, inputs, loop=False):
+        self.inputs = list(inputs);
+        self.loop = loop;
+
+    def __call__(self, env, tick):
+        if self.loop:
+            return self.inputs[tick % len(self.inputs)];
+        # hold the last input once the script runs out
+        return self.inputs[min(tick, len(self.inputs) - 1)];
@@ -0,0 +1,83 @@
+from array import array;
+from collections import deque;
+import Scene;
+
+"""Flow-field pathfinding shared by every banana."""
+
+
+TILE = Scene.TILE_SIZE;
+# straight moves first so the search prefers them when there's a tie
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1));
+SOLID = bytes(1 if tile in (Scene.WALL, Scene.VERTICAL_WALL) else 0 for tile in range(256));
+
+
+class FlowField():
+
+    """ a breadth first search out from the player's tile, stored as one step per tile
+
+    Every tile the search reached points at its neighbour one step closer to the player,
+    so any number of bananas can look up where to go next. It is only searched again
+    when the player has moved onto a different tile and a banana asks for directions.
+    """
+
+    def __init__(self, scene, radius=48):
+        self.columns, self.rows = scene.columns, scene.rows;
+        self.radius = radius; # how many steps out from the player the search goes
+        self.blocked = bytes(scene.cells).translate(SOLID);
+        size = self.columns * self.rows;
+        self.step_x = array("b", bytes(size));
+        self.step_y = array("b", bytes(size));
+        self.reached = bytearray(size);
+        self.origin = None;
+        self.target = None; # the player's tile, searched from on the next lookup
+        self.searches = 0;
+
+    def tile(self, pos):
+        return int(pos[0]) // TILE, int(pos[1]) // TILE;
+
+    def update(self, rect):
+        """ follow the player, once per tick """
+        self.target = self.tile(rect.center);
+
+    def refresh(self):
+        """ search again if the player is on a new tile since the last search """
+        if self.target != self.origin:
+            self.origin = self.target;
+            self.search(*self.origin);
+
+    def search(self, ox, oy):
+        columns, rows = self.columns, self.rows;
+        blocked, step_x, step_y = self.blocked, self.step_x, self.step_y;
+        self.reached = reached = bytearray(columns * rows);
+        self.searches += 1;
+        if not (0 <= ox < columns and 0 <= oy < rows) or blocked[oy * columns + ox]:
+            return;
+
+        reached[oy * columns + ox] = 1;
+        step_x[oy * columns + ox] = step_y[oy * columns + ox] = 0;
+        queue = deque([(ox, oy, 0)]);
+        radius = self.radius;
+        while queue:
+            x, y, distance = queue.popleft();
+            if distance >= radius: continue;
+            for dx, dy in NEIGHBOURS:
+                nx, ny = x + dx, y + dy;
+                if not (0 <= nx < columns and 0 <= ny < rows): continue;
+                i = ny * columns + nx;
+                if reached[i] or blocked[i]: continue;
+                # no cutting corners, a banana is as wide as a tile
+                if dx and dy and (blocked[y * columns + nx] or blocked[ny * columns + x]): continue;
+                reached[i] = 1;
+                step_x[i], step_y[i] = -dx, -dy;
+                queue.append((nx, ny, distance + 1));
+
+    def waypoint(self, rect):
+        """ the top left of the tile a banana at rect should head for, or None to go straight at the player """
+        if self.target != self.origin: self.refresh();
+        x, y = self.tile(rect.center);
+        if not (0 <= x < self.columns and 0 <= y < self.rows): return None;
+        i = y * self.columns + x;
+        if not self.reached[i]: return None;
+        x, y = x + self.step_x[i], y + self.step_y[i];
+        if (x, y) == self.origin: return None;
+        return x * TILE, y * TILE;
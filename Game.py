@@ -4,6 +4,9 @@ from random import randint;
 """Contains classes and helper functions used in the game."""
 
 
+TICK_RATE = 30; # simulation ticks per second, whatever the frame rate
+TICK = 1 / TICK_RATE; # seconds per tick, the dt everything moves by
+
 
 def get_angle(angle):
     """ gets the angle the player or the enemy should be facing """
@@ -11,15 +14,48 @@ def get_angle(angle):
     if 45 < angle <= 135: angle = 90;
     elif 135 < angle <= 225: angle = 180;
     elif 225 < angle <= 315: angle = 270;
-    elif 315 < angle <= 360 or 0 < angle < 45: angle = 0;
+    elif 315 < angle <= 360 or 0 <= angle <= 45: angle = 0;
     return angle;
 
-def rotate(sprite, dx, dy, angle, image):
-    """ rotates an image by angle """
-    rotated_image = pygame.transform.rotate(image, angle);
-    sprite.rect = rotated_image.get_rect(center=sprite.rect.center);
-    sprite.image = pygame.transform.scale(sprite.image, (sprite.rect.width, sprite.rect.height));
-    return rotated_image;
+
+class RotationCache():
+
+    """ images rotated ahead of time to the angles get_angle snaps to """
+
+    def __init__(self):
+        self.frames = {};
+
+    def add(self, image, angles=(0, 90, 180, 270)):
+        """ rotate an image to every angle up front """
+        frames = self.frames.setdefault(image, {});
+        for angle in angles:
+            frames[angle] = pygame.transform.rotate(image, angle);
+
+    def get(self, image, angle):
+        """ the rotated image, rotating it now if it wasn't cached """
+        frames = self.frames.setdefault(image, {});
+        rotated_image = frames.get(angle);
+        if rotated_image is None:
+            rotated_image = frames[angle] = pygame.transform.rotate(image, angle);
+        return rotated_image;
+
+
+rotations = RotationCache();
+
+
+def toward(pos, goal, step):
+    """ pos moved step pixels towards goal, at least one pixel so rounding can't stall it, never past it """
+    if pos < goal: return min(goal, pos + max(1, step));
+    if pos > goal: return max(goal, pos - max(1, step));
+    return pos;
+
+
+def face(sprite, angle):
+    """ point a sprite's image at angle, keeping the rect centered """
+    sprite.angle = angle;
+    sprite.image = rotations.get(sprite.background, angle);
+    if sprite.image.get_size() != sprite.rect.size:
+        sprite.rect = sprite.image.get_rect(center=sprite.rect.center);
 
 
 class Entity(pygame.sprite.Sprite):
@@ -31,17 +67,22 @@ class Entity(pygame.sprite.Sprite):
         self.add(*groups);
 
     def wall_collide(self, walls, target, x_vel, y_vel):
-        """ check for collisions with the walls """
-        for w in walls:
-            if pygame.sprite.collide_rect(target, w):
-                if x_vel > 0:
-                    target.rect.right = w.rect.left;
-                elif x_vel < 0:
-                    target.rect.left = w.rect.right;
-                if y_vel > 0:
-                    target.rect.bottom = w.rect.top;
-                elif y_vel < 0:
-                    target.rect.top = w.rect.bottom;
+        """ check for collisions with the walls (a Spatial.TileGrid) """
+        # walls are visited in the order they were loaded, and the grid is asked again
+        # every time the rect gets pushed, so this resolves exactly like a loop over all of them
+        last = -1;
+        while True:
+            hits = [hit for hit in walls.query(target.rect) if hit[0] > last];
+            if not hits: break;
+            last, w = hits[0];
+            if x_vel > 0:
+                target.rect.right = w.rect.left;
+            elif x_vel < 0:
+                target.rect.left = w.rect.right;
+            if y_vel > 0:
+                target.rect.bottom = w.rect.top;
+            elif y_vel < 0:
+                target.rect.top = w.rect.bottom;
 
     def update(self, *args):
         """ to be overridden by subclasses """
@@ -52,12 +93,13 @@ class Player(Entity):
 
     """ The player that the user controls """
 
-    def __init__(self, groups, pos, background):
+    def __init__(self, groups, pos, background, bullet_image=None):
         Entity.__init__(self, groups);
 
         self.width, self.height = 32, 32;
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect();
+        self.image = rotations.get(background, 0);
+        self.angle = 0;
+        self.rect = pygame.Rect(0, 0, self.width, self.height);
         self.rect.x, self.rect.y = pos;
         self.x_vel, self.y_vel = 0, 0;
         self.moving = False;
@@ -66,13 +108,14 @@ class Player(Entity):
         self.gems, self.xp = 0, 0;
         self.level = 1;
         self.weapon_active = False;
-        self.speed = 14;
-        self.bullets = pygame.sprite.Group();
+        self.speed = 420; # pixels per second
+        self.bullets = BulletPool(bullet_image, 1000);
 
         self.background = background;
+        self.prev_pos = self.rect.topleft; # where the last tick started, for interpolated drawing
 
-    def move(self, walls, mouse_x, mouse_y, dx, dy):
-        """ move the player towards the cursor """
+    def move(self, walls, mouse_x, mouse_y, dx, dy, dt=TICK):
+        """ move the player towards the cursor, velocities are in pixels per second """
         distance = math.hypot(dx, dy);
         if self.rect.collidepoint((mouse_x, mouse_y)):
             self.rect.centerx = mouse_x;
@@ -84,9 +127,9 @@ class Player(Entity):
             self.x_vel = -(dx * self.speed);
             self.y_vel = -(dy * self.speed);
 
-        self.rect.x += self.x_vel;
+        self.rect.x += self.x_vel * dt;
         self.wall_collide(walls, self, self.x_vel, 0);
-        self.rect.y += self.y_vel;
+        self.rect.y += self.y_vel * dt;
         self.wall_collide(walls, self, 0, self.y_vel);
 
     def level_up(self):
@@ -104,45 +147,43 @@ class Player(Entity):
         """ allow the player to shoot """
         self.weapon_active = True;
 
-    def shoot(self, mouse_pos, img):
-        """ shoot bullets towards the mouse """
-        if self.weapon_active and len(self.bullets.sprites()) < 1000 and self.shooting:
-            Bullet([self.bullets], (self.rect.centerx, self.rect.centery), mouse_pos, img);
+    def shoot(self, mouse_pos):
+        """ shoot bullets towards the mouse, at most 1000 at a time """
+        if self.weapon_active and self.shooting:
+            self.bullets.fire((self.rect.centerx, self.rect.centery), mouse_pos);
 
-    def update(self, walls, mouse_pos, enemies):
+    def update(self, walls, mouse_pos, dt=TICK):
+        self.prev_pos = self.rect.topleft;
         mouse_x, mouse_y = mouse_pos;
         dx, dy = self.rect.centerx - mouse_x, self.rect.centery - mouse_y;
         if self.moving:
-            self.move(walls, mouse_x, mouse_y, dx, dy);
+            self.move(walls, mouse_x, mouse_y, dx, dy, dt);
         angle = get_angle(90 - math.degrees(math.atan2(dy, dx)));
-        rotated_image = rotate(self, dx, dy, angle, self.background);
+        face(self, angle);
         
         self.level_up();
 
-        self.image.fill(pygame.Color(0, 0, 0, 0)); # Clear the image
-        self.image.blit(rotated_image, (0, 0));
-
-        self.bullets.update(enemies, self);
-
 
 class Enemy(Entity):
 
     """ Tracking Banana enemy """
 
-    def __init__(self, groups, pos, background):
+    def __init__(self, groups, pos, background, speed=None):
         Entity.__init__(self, groups);
 
         self.width, self.height = 32, 32;
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect(center=pos);
+        self.image = rotations.get(background, 0);
+        self.angle = 0;
+        self.rect = pygame.Rect(0, 0, self.width, self.height);
         self.rect.x, self.rect.y = pos;
         self.x_vel, self.y_vel = 0, 0;
-        self.speed = randint(3, 7);
+        self.speed = speed or randint(3, 7) * TICK_RATE; # pixels per second
 
         self.trigger_rect = pygame.Rect(self.rect.x-184, self.rect.y-184, 400, 400);
         self.active = False; # Once active, always active.
 
         self.background = background;
+        self.prev_pos = None; # set once it starts moving
 
     def collide(self, target):
         """ check for collision with the player """
@@ -150,7 +191,7 @@ class Enemy(Entity):
             target.xp -= 20;
             self.kill();
 
-    def move(self, walls, dx, dy):
+    def move(self, walls, dx, dy, dt=TICK):
         """ move towards the player """
         distance = math.hypot(dx, dy);
 
@@ -160,61 +201,75 @@ class Enemy(Entity):
             self.x_vel = -(dx * self.speed);
             self.y_vel = -(dy * self.speed);
 
-        self.rect.x += self.x_vel;
+        self.rect.x += self.x_vel * dt;
         self.wall_collide(walls, self, self.x_vel, 0);
-        self.rect.y += self.y_vel;
+        self.rect.y += self.y_vel * dt;
         self.wall_collide(walls, self, 0, self.y_vel);
 
-    def update(self, walls, target):
+    def follow(self, walls, goal, dt=TICK):
+        """ move the rect's top left onto goal, a tile's top left, so it lines up with the tiles it goes between """
+        dx, dy = self.rect.x - goal[0], self.rect.y - goal[1];
+        distance = math.hypot(dx, dy);
+        self.x_vel = -(dx / distance * self.speed);
+        self.y_vel = -(dy / distance * self.speed);
+
+        self.rect.x = round(toward(self.rect.x, goal[0], abs(self.x_vel * dt)));
+        self.wall_collide(walls, self, self.x_vel, 0);
+        self.rect.y = round(toward(self.rect.y, goal[1], abs(self.y_vel * dt)));
+        self.wall_collide(walls, self, 0, self.y_vel);
+
+    def update(self, walls, target, field=None, dt=TICK):
+        """ field is an optional Flow.FlowField to find a way around walls """
         if self.active:
-            dx = self.rect.x - target.rect.x;
-            dy = self.rect.y - target.rect.y;
+            self.prev_pos = self.rect.topleft;
+            waypoint = field.waypoint(self.rect) if field else None;
+            if waypoint:
+                dx = self.rect.x - waypoint[0];
+                dy = self.rect.y - waypoint[1];
+            else:
+                dx = self.rect.x - target.rect.x;
+                dy = self.rect.y - target.rect.y;
 
             angle = get_angle(-math.degrees(math.atan2(dy, dx)));
-            rotated_image = rotate(self, dx, dy, angle, self.background);
-            self.move(walls, dx, dy);
+            face(self, angle);
+            if waypoint:
+                self.follow(walls, waypoint, dt);
+            else:
+                self.move(walls, dx, dy, dt);
             self.collide(target)
-
-            self.image.fill((0, 0, 0, 0));
-            self.image.blit(rotated_image, (0, 0));
         else:
             if self.trigger_rect.colliderect(target.rect):
                 self.active = True;
-            self.image.blit(self.background, (0, 0));
 
 
-class Wall(Entity):
+class Tile():
 
-    """ walls that serve as the boundaries and obstacles """
+    """ something that sits on the grid and never changes: a rect and a shared image, not a sprite """
 
-    def __init__(self, groups, pos, image, orientation="horizontal"):
-        Entity.__init__(self, groups);
+    __slots__ = ("rect", "image");
 
-        self.width, self.height = 32, 32;
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect();
-        self.rect.x, self.rect.y = pos;
+    def __init__(self, pos, image, size=None):
+        self.image = image;
+        self.rect = pygame.Rect(pos, size or image.get_size());
 
-        if orientation == "horizontal":
-            self.background = image;
-        else:
-            self.background = pygame.transform.rotate(image, 90);
 
-        self.image.blit(self.background, (0, 0));
+class Wall(Tile):
 
+    """ walls that serve as the boundaries and obstacles """
 
-class Scenery(Entity):
+    __slots__ = ();
 
-    """ For other objects in the game to make it look good """
+    def __init__(self, pos, image, orientation="horizontal"):
+        if orientation != "horizontal":
+            image = rotations.get(image, 90); # one rotated copy for every vertical wall
+        Tile.__init__(self, pos, image, (32, 32));
 
-    def __init__(self, groups, pos, img):
-        Entity.__init__(self, groups);
 
-        *_, self.width, self.height = img.get_rect();
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect();
-        self.rect.x, self.rect.y = pos;
-        self.image.blit(img, (0, 0));
+class Scenery(Tile):
+
+    """ For other objects in the game to make it look good """
+
+    __slots__ = ();
 
 
 class Item(Entity):
@@ -225,10 +280,9 @@ class Item(Entity):
         Entity.__init__(self, groups);
 
         *_, self.width, self.height = img.get_rect();
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect();
+        self.image = img; # shared with every other item of its kind
+        self.rect = img.get_rect();
         self.rect.x, self.rect.y = pos;
-        self.image.blit(img, (0, 0));
 
         self.function = function;
         self.k = kill;
@@ -239,50 +293,97 @@ class Item(Entity):
             if self.k: self.kill();
 
 
-class Bullet(Entity):
+class Bullet():
 
-    """ ^^^ it's in the name """
+    """ ^^^ it's in the name. Bullets live in a BulletPool and get reused """
 
-    def __init__(self, groups, start, end, img):
-        Entity.__init__(self, groups);
+    __slots__ = ("x", "y", "x_vel", "y_vel", "rect", "endrect", "image", "live", "prev_pos");
 
-        self.width, self.height = 10, 10;
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA, 32);
-        self.rect = self.image.get_rect();
-        self.rect.x, self.rect.y = start;
+    def __init__(self, image):
+        self.x, self.y = 0.0, 0.0;
+        self.x_vel, self.y_vel = 0.0, 0.0;
+        self.rect = pygame.Rect(0, 0, 10, 10);
+        self.endrect = pygame.Rect(0, 0, 15, 15);
+        self.image = image;
+        self.live = False;
+        self.prev_pos = None;
 
-        self.end = end;
-        self.endrect = pygame.Rect(end[0]-7, end[1]-7, 15, 15)
-        self.img = img;
+    def fire(self, start, end, speed=450):
+        """ aim along the vector between the origin point (player) and the mouse, once """
+        self.x, self.y = start;
+        self.rect.x, self.rect.y = start;
+        self.prev_pos = self.rect.topleft;
+        self.endrect.center = end;
+        dx, dy = end[0] - self.x, end[1] - self.y;
+        distance = math.hypot(dx, dy);
+        if distance:
+            self.x_vel, self.y_vel = (dx / distance) * speed, (dy / distance) * speed;
+        else:
+            self.x_vel, self.y_vel = 0.0, 0.0;
+        self.live = True;
 
-        self.image.blit(self.img, (0, 0));
+    def kill(self):
+        self.live = False;
 
     def collide(self, targets, player):
-        """ check if the bullets hit the bananas """
+        """ check if the bullets hit the bananas (targets is a Spatial.SpatialHash) """
         if self.rect.colliderect(self.endrect): self.kill();
-        for target in targets:
-            if self.rect.colliderect(target.rect):
-                target.kill();
-                self.kill();
-                player.xp += 10;
-
-    def move(self, target):
-        """ move along the vector between the origin point (player) and the mouse """
-        if target.moving:
-            x = 0;#target.speed;
-        else:
-            x = 0;
+        for target in targets.query(self.rect):
+            target.kill();
+            self.kill();
+            player.xp += 10;
 
-        dx = self.end[0] - self.rect.x;
-        dy = self.end[1] - self.rect.y;
-        distance = math.hypot(dx, dy);
-        
-        if distance:
-            x_vel = (dx / distance) * (15 + x);
-            y_vel = (dy / distance) * (15 + x); 
-            self.rect.x += x_vel;
-            self.rect.y += y_vel;
+    def move(self, dt=TICK):
+        self.prev_pos = self.rect.topleft;
+        self.x += self.x_vel * dt;
+        self.y += self.y_vel * dt;
+        self.rect.x, self.rect.y = self.x, self.y;
 
-    def update(self, targets, player):
-        self.move(player);
+    def update(self, targets, player, dt=TICK):
+        self.move(dt);
         self.collide(targets, player);
+
+
+class BulletPool():
+
+    """ a fixed set of bullets that are handed out when fired and taken back when they die """
+
+    def __init__(self, img, size=1000, bounds=None):
+        # one surface for every bullet
+        self.image = pygame.Surface((10, 10), pygame.SRCALPHA, 32);
+        if img is not None:
+            self.image.blit(img, (0, 0));
+        self.free = [Bullet(self.image) for i in range(size)];
+        self.live = [];
+        self.bounds = bounds; # bullets leaving this Rect (the level) die
+
+    def __len__(self):
+        return len(self.live);
+
+    def __iter__(self):
+        return iter(self.live);
+
+    def fire(self, start, end):
+        """ shoot a bullet from start towards end, unless they are all in use """
+        if not self.free: return None;
+        bullet = self.free.pop();
+        bullet.fire(start, end);
+        self.live.append(bullet);
+        return bullet;
+
+    def update(self, targets, player, dt=TICK):
+        bounds = self.bounds;
+        for bullet in self.live:
+            bullet.update(targets, player, dt);
+            if bounds and bullet.live and not bounds.colliderect(bullet.rect):
+                bullet.kill();
+
+        if not all(bullet.live for bullet in self.live):
+            self.free.extend(bullet for bullet in self.live if not bullet.live);
+            self.live = [bullet for bullet in self.live if bullet.live];
+
+    def empty(self):
+        for bullet in self.live:
+            bullet.kill();
+        self.free.extend(self.live);
+        self.live = [];
@@ -0,0 +1,105 @@
+import pygame, csv, time;
+
+"""Per-frame timing and counters for the main loop."""
+
+
+class FrameProfiler():
+
+    """ times each phase of a frame, counts what happened in it and can draw itself on screen """
+
+    def __init__(self, overlay=False, trace=None):
+        self.overlay = overlay;
+        self.trace = trace; # file name for a per-frame CSV, or None
+        self.phases = {};
+        self.counters = {};
+        self.frame = 0;
+        self.last = self.start = 0.0;
+        self.font = None;
+        self.report = [];
+        self.writer = None;
+        self.file = None;
+        self.columns = None;
+        self.timing = False; # between begin and end
+
+    def begin(self):
+        """ start timing a new frame, unless one is already going (several ticks can go in one frame) """
+        if self.timing: return;
+        self.timing = True;
+        self.phases = {};
+        self.counters = {};
+        self.start = self.last = time.perf_counter();
+
+    def mark(self, phase):
+        """ the time since the last mark belongs to phase """
+        now = time.perf_counter();
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last;
+        self.last = now;
+
+    def count(self, name, value):
+        self.counters[name] = value;
+
+    def end(self):
+        """ finish the frame and write it to the trace """
+        self.timing = False;
+        self.phases["total"] = time.perf_counter() - self.start;
+        if self.trace:
+            if self.writer is None or not (self.phases.keys() <= set(self.columns[0])
+                                           and self.counters.keys() <= set(self.columns[1])):
+                self.widen();
+            phases, counters = self.columns;
+            self.writer.writerow([self.frame] + ["{:.4f}".format(self.phases.get(name, 0.0) * 1000) for name in phases]
+                                 + [self.counters.get(name, 0) for name in counters]);
+        if self.overlay:
+            self.report = self.lines();
+        self.frame += 1;
+
+    def widen(self):
+        """ (re)start the trace with this frame's phases and counters added to the columns
+
+        Not every frame has every phase (a frame can go by without a tick), so the
+        frames already written are copied over with 0 in the new columns.
+        """
+        phases, counters = set(self.phases), set(self.counters);
+        rows = [];
+        if self.file:
+            self.file.close();
+            with open(self.trace, newline="") as f:
+                rows = list(csv.reader(f));
+            phases.update(self.columns[0]);
+            counters.update(self.columns[1]);
+        self.columns = sorted(phases), sorted(counters);
+        header = ["frame"] + [name + "_ms" for name in self.columns[0]] + self.columns[1];
+        self.file = open(self.trace, "w", newline="");
+        self.writer = csv.writer(self.file);
+        self.writer.writerow(header);
+        if rows:
+            old = rows[0];
+            blank = ["0"] + ["0.0000"] * len(self.columns[0]) + ["0"] * len(self.columns[1]);
+            for row in rows[1:]:
+                values = dict(zip(old, row));
+                self.writer.writerow([values.get(name, default) for name, default in zip(header, blank)]);
+
+    def lines(self):
+        phases = ["{:>15}: {:6.2f} ms".format(name, seconds * 1000) for name, seconds in self.phases.items()];
+        counters = ["{:>15}: {}".format(name, value) for name, value in self.counters.items()];
+        return phases + counters;
+
+    def draw(self, surface):
+        """ draw the last finished frame's numbers in the top left corner, returning the rects drawn on """
+        if not self.overlay: return [];
+        return surface.blits(self.blits());
+
+    def blits(self):
+        """ the (image, position) pairs draw blits, for drawing them somewhere else """
+        if not self.overlay: return [];
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18);
+        return [(self.font.render(line, True, (255, 255, 255), (0, 0, 0)), (4, 4 + 14 * n))
+                for n, line in enumerate(self.report)];
+
+    def close(self):
+        """ finish the trace, nothing more is written to it after this """
+        self.trace = None;
+        if self.file:
+            self.file.close();
+            self.file = self.writer = None;
@@ -0,0 +1,236 @@
+import pygame, math, threading, queue;
+
+
+class Renderer():
+
+    """ draws layers of sprites through the camera, skipping anything off screen """
+
+    threaded = False; # whether another thread draws on the window
+
+    def __init__(self, camera):
+        self.camera = camera;
+        self.view = pygame.Rect(0, 0, camera.width, camera.height);
+        self.drawn, self.culled = 0, 0;
+
+    def batches(self, layers, alpha=1.0):
+        """ the (image, screen position) blits for each layer, leaving out anything off screen
+
+        alpha is how far between the last two ticks the frame is; anything with a prev_pos
+        (and the camera) is drawn that far along the way from there to where it is now.
+        A layer can also be a function that takes the view and returns the layer's sprites
+        that might be in it (from a spatial index), so only those get tested; culled counts
+        the sprites that were tested and left out.
+        """
+        left, top = self.camera.offset(alpha);
+        view = self.view;
+        view.x, view.y = -left, -top; # the part of the world the camera can see
+        batches = [];
+        drawn = culled = 0;
+
+        for layer in layers:
+            if callable(layer):
+                layer = layer(view);
+            batch = self.camera.to_screen(layer, (left, top), view, alpha);
+            batches.append(batch);
+            drawn += len(batch);
+            culled += len(layer) - len(batch);
+
+        self.drawn, self.culled = drawn, culled;
+        return (left, top), batches;
+
+    def draw(self, surface, layers, alpha=1.0, overlays=()):
+        """ blit each layer in one batch, back to front, then overlays ((image, screen position) pairs) """
+        offset, batches = self.batches(layers, alpha);
+        for batch in batches:
+            surface.blits(batch, False);
+        surface.blits(overlays, False);
+        return self.drawn, self.culled;
+
+    def touch(self, rects):
+        """ screen areas drawn on after draw, Renderer redraws everything anyway """
+        pass;
+
+    def present(self):
+        pygame.display.flip();
+
+    def finish(self):
+        """ wait until everything drawn so far is on screen, it already is here """
+        pass;
+
+    def close(self):
+        pass;
+
+
+class DirtyRenderer(Renderer):
+
+    """ only redraws and updates the parts of the screen that changed, while the camera holds still
+
+    Each frame's blits are compared with the last frame's. Where something appeared, moved,
+    changed or went away, that part of the screen is drawn again and handed to display.update.
+    If the camera moved, or more than max_rects areas changed, the whole screen is drawn and
+    flipped like Renderer does.
+    """
+
+    def __init__(self, camera, max_rects=48):
+        Renderer.__init__(self, camera);
+        self.max_rects = max_rects;
+        self.offset = None;
+        self.last = {}; # (layer, image, position) -> screen rect, for every blit last frame
+        self.dirty = None; # the rects to update this frame, None for all of it
+        self.touched = []; # drawn over after the world last frame, so they need repainting
+        self.full_frames = self.partial_frames = 0;
+
+    def draw(self, surface, layers, alpha=1.0, overlays=()):
+        offset, batches = self.batches(layers, alpha);
+        batches.append(list(overlays));
+        current = {(n, image, pos): pygame.Rect(pos, image.get_size())
+                   for n, batch in enumerate(batches) for image, pos in batch};
+
+        changed = self.touched + [current.get(key) or self.last[key] for key in current.keys() ^ self.last.keys()];
+        self.last, self.touched = current, [];
+        if offset != self.offset or len(changed) > self.max_rects:
+            self.offset = offset;
+            for batch in batches:
+                surface.blits(batch, False);
+            self.dirty = None;
+            self.full_frames += 1;
+            return self.drawn, self.culled;
+
+        screen = surface.get_rect();
+        self.dirty = [rect.clip(screen) for rect in changed if rect.colliderect(screen)];
+        drawn = 0;
+        for area in self.dirty:
+            surface.set_clip(area);
+            for batch in batches:
+                blits = [(image, pos) for image, pos in batch if area.colliderect((pos, image.get_size()))];
+                surface.blits(blits, False);
+                drawn += len(blits);
+        surface.set_clip(None);
+        self.drawn = drawn;
+        self.partial_frames += 1;
+        return self.drawn, self.culled;
+
+    def touch(self, rects):
+        """ screen areas drawn on after draw: update them now and repaint them next frame """
+        self.touched.extend(rects);
+        if self.dirty is not None:
+            self.dirty.extend(rects);
+
+    def present(self):
+        if self.dirty is None:
+            pygame.display.flip();
+        else:
+            pygame.display.update(self.dirty);
+
+
+class PipelinedRenderer(Renderer):
+
+    """ blits and flips on a render thread while the main thread simulates the next frame
+
+    draw only works out the frame's draw list: a tuple of (image, screen position) pairs,
+    made on the main thread so nothing the game does afterwards can change it. present hands
+    it to the render thread through a queue that holds depth frames, waiting if the render
+    thread is that far behind, so a frame shows up at most one frame late with the default
+    depth and they never pile up. While it runs the render thread is the only thing that draws
+    on the window; pygame lets go of the GIL for the blits and the flip, so on more than one
+    core they overlap with the next frame's update.
+    """
+
+    threaded = True;
+
+    def __init__(self, camera, depth=1):
+        Renderer.__init__(self, camera);
+        self.frames = queue.Queue(depth); # (surface, draw list), None to stop
+        self.frame = None;
+        self.error = None; # raised on the main thread by the next present
+        self.waits = 0; # frames present had to wait for the render thread
+        self.closed = False;
+        self.thread = threading.Thread(target=self.work, name="renderer", daemon=True);
+        self.thread.start();
+
+    def draw(self, surface, layers, alpha=1.0, overlays=()):
+        offset, batches = self.batches(layers, alpha);
+        self.frame = (surface, tuple(blit for batch in batches for blit in batch) + tuple(overlays));
+        return self.drawn, self.culled;
+
+    def present(self):
+        if self.error: raise self.error;
+        if self.frame is None or self.closed: return;
+        if self.frames.full():
+            self.waits += 1;
+        self.frames.put(self.frame);
+        self.frame = None;
+
+    def work(self):
+        """ the render thread: draw and flip each frame as it comes """
+        while True:
+            frame = self.frames.get();
+            try:
+                if frame is None: return;
+                surface, blits = frame;
+                surface.blits(blits, False);
+                pygame.display.flip();
+            except Exception as e:
+                self.error = e;
+            finally:
+                self.frames.task_done();
+
+    def finish(self):
+        self.frames.join();
+
+    def close(self):
+        """ draw whatever is queued and stop the render thread """
+        if self.closed: return;
+        self.closed = True;
+        self.frames.put(None);
+        self.thread.join();
+
+
+class Chunk():
+
+    """ one pre-baked piece of the static layer """
+
+    def __init__(self, rect, image):
+        self.rect = rect;
+        self.image = image;
+
+
+def bake_chunk(tile, rect, sprites):
+    """ the background tiled over rect, with the sprites that never move drawn on top """
+    *_, iwidth, iheight = tile.get_rect();
+    image = pygame.Surface(rect.size);
+    # the background tiles line up with the world, not with the chunk
+    image.blits([(tile, (x - rect.x, y - rect.y))
+                 for y in range(rect.y - rect.y % iheight, rect.bottom, iheight)
+                 for x in range(rect.x - rect.x % iwidth, rect.right, iwidth)], False);
+    image.blits([(spr.image, (spr.rect.x - rect.x, spr.rect.y - rect.y)) for spr in sprites], False);
+    return Chunk(rect, image.convert());
+
+
+class StaticLayer():
+
+    """ the background, walls and scenery baked into large chunks when a scene loads """
+
+    def __init__(self, width, height, chunk_size=512):
+        self.width, self.height = width, height;
+        self.chunk_size = chunk_size;
+        self.chunks = [];
+
+    def bake(self, tile, sprites):
+        """ tile the background and draw the sprites that never move into each chunk """
+        size = self.chunk_size;
+        columns = math.ceil(self.width / size);
+        rows = math.ceil(self.height / size);
+        buckets = {};
+        for spr in sprites:
+            rect = spr.rect;
+            for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                for col in range(rect.left // size, (rect.right - 1) // size + 1):
+                    buckets.setdefault((col, row), []).append(spr);
+
+        self.chunks = [];
+        for row in range(rows):
+            for col in range(columns):
+                rect = pygame.Rect(col * size, row * size, size, size).clip((0, 0, self.width, self.height));
+                self.chunks.append(bake_chunk(tile, rect, buckets.get((col, row), ())));
+        return self.chunks;
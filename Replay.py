@@ -0,0 +1,102 @@
+import os, struct;
+
+"""Records the input of a play session so it can be played back exactly."""
+
+
+MAGIC = b"TDRP";
+VERSION = 2;
+HEADER = struct.Struct("<4sBII"); # magic, version, seed, number of ticks
+# camera smoothing, pathfinding, streaming, chunk budget, lod, lod budget (-1 for none); version 2 on
+SETTINGS = struct.Struct("<dBBiBi");
+TICK = struct.Struct("<iiB"); # mouse world x, mouse world y, moving | shooting << 1
+HERE = os.path.dirname(os.path.abspath(__file__));
+
+
+def settings(env):
+    """ the Environment settings that change how a game plays out, so a replay has to use them too """
+    return {"camera_smoothing": env.camera_smoothing, "pathfinding": env.pathfinding,
+            "streaming": env.streaming, "chunk_budget": env.chunk_budget,
+            "lod": env.lod, "lod_budget": env.lod_budget};
+
+
+class Recorder():
+
+    """ captures the input for every tick along with the seed the scene was loaded with """
+
+    def __init__(self, path, seed, scene, settings):
+        if not 0 <= seed < 1 << 32:
+            raise ValueError("a recording's seed has to fit in 32 bits");
+        self.path = path;
+        self.seed = seed;
+        self.scene = os.path.abspath(scene); # so it replays from anywhere
+        self.settings = settings; # from Replay.settings
+        self.ticks = 0;
+        self.data = bytearray();
+
+    def record(self, env, mouse_pos):
+        """ store one tick of input, call it right before env.step """
+        x, y = env.camera.reverse(mouse_pos);
+        self.data += TICK.pack(int(x), int(y), env.player.moving | env.player.shooting << 1);
+        self.ticks += 1;
+
+    def save(self, path=None):
+        scene = self.scene.encode("utf-8");
+        with open(path or self.path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, self.ticks));
+            s = self.settings;
+            f.write(SETTINGS.pack(s["camera_smoothing"], s["pathfinding"], s["streaming"], s["chunk_budget"],
+                                  s["lod"], -1 if s["lod_budget"] is None else s["lod_budget"]));
+            f.write(struct.pack("<H", len(scene)) + scene);
+            f.write(self.data);
+
+
+class Replayer():
+
+    """ feeds recorded input back into an Environment, use it as a simulate controller """
+
+    def __init__(self, seed, scene, inputs, settings=None):
+        self.seed = seed;
+        self.scene = scene;
+        self.inputs = inputs;
+        self.settings = settings; # None for recordings made before they were saved
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read();
+        magic, version, seed, ticks = HEADER.unpack_from(data, 0);
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError("{} is not a replay this version can read".format(path));
+        offset = HEADER.size;
+        settings = None;
+        if version >= 2:
+            smoothing, pathfinding, streaming, chunk_budget, lod, lod_budget = SETTINGS.unpack_from(data, offset);
+            offset += SETTINGS.size;
+            settings = {"camera_smoothing": smoothing, "pathfinding": bool(pathfinding),
+                        "streaming": bool(streaming), "chunk_budget": chunk_budget,
+                        "lod": bool(lod), "lod_budget": None if lod_budget < 0 else lod_budget};
+        length, = struct.unpack_from("<H", data, offset);
+        offset += 2;
+        scene = data[offset:offset + length].decode("utf-8");
+        if not os.path.isabs(scene) and not os.path.exists(scene):
+            # older recordings kept the path as typed, usually relative to the game's folder
+            scene = os.path.join(HERE, scene);
+        offset += length;
+        inputs = [(x, y, bool(flags & 1), bool(flags & 2))
+                  for x, y, flags in TICK.iter_unpack(data[offset:offset + ticks * TICK.size])];
+        return cls(seed, scene, inputs, settings);
+
+    def __len__(self):
+        return len(self.inputs);
+
+    def __call__(self, env, tick):
+        x, y, moving, shooting = self.inputs[tick];
+        # the camera is where it was when this tick was recorded, so this is the original screen position
+        return env.camera.apply_pos((x, y)), moving, shooting;
+
+    def replay(self, env, render=False):
+        """ run the whole recording through env, set up the way it was recorded, and return the final stats """
+        env.seed = self.seed;
+        for name, value in (self.settings or {}).items():
+            setattr(env, name, value);
+        return env.simulate(self.scene, len(self.inputs), self, render);
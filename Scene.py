@@ -0,0 +1,153 @@
+import os, sys, mmap, struct, hashlib, tempfile;
+
+"""Reads scene files, compiling the text format into a cached binary tile grid."""
+
+
+EMPTY, WALL, VERTICAL_WALL, BUSH, WATER, GEM, ENEMY, DOOR, GUN = range(9);
+
+# every character load_scene understands and the tile it stands for
+TILES = {"1": WALL, "H": WALL, "2": VERTICAL_WALL, "V": VERTICAL_WALL, "3": BUSH, "B": BUSH,
+         "4": WATER, "W": WATER, "5": GEM, "G": GEM, "6": ENEMY, "E": ENEMY, "7": DOOR, "D": DOOR,
+         "8": GUN, "S": GUN};
+
+MAGIC = b"TDSC";
+VERSION = 1;
+# magic, version, level columns, grid columns, rows, source mtime (ns), source size, source digest
+HEADER = struct.Struct("<4sBiIIqQ16s");
+CACHE_DIR = "__scenecache__";
+TILE_SIZE = 32;
+
+
+class SceneGrid():
+
+    """ a scene as one byte per tile, row by row """
+
+    def __init__(self, level_columns, columns, rows, cells):
+        self.level_columns = level_columns; # measured from the first line, like the text loader always did
+        self.columns, self.rows = columns, rows;
+        self.cells = cells;
+
+    @property
+    def dimensions(self):
+        """ level width and height in pixels """
+        return TILE_SIZE * self.level_columns, TILE_SIZE * self.rows;
+
+    def row(self, y):
+        return self.cells[y * self.columns:(y + 1) * self.columns];
+
+    def tile(self, x, y):
+        if 0 <= x < self.columns and 0 <= y < self.rows:
+            return self.cells[y * self.columns + x];
+        return EMPTY;
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest();
+
+
+def parse(text):
+    """ turn the text format into a SceneGrid """
+    rows = text.split("\n");
+    if rows[-1] == "": rows.pop();
+    # the first line's length, newline included, - 1 because of newline character
+    level_columns = len(rows[0]) + ("\n" in text) - 1;
+    columns = max(len(row) for row in rows);
+    cells = bytearray(columns * len(rows));
+    for y, row in enumerate(rows):
+        offset = y * columns;
+        for x, char in enumerate(row):
+            cells[offset + x] = TILES.get(char, EMPTY);
+    return SceneGrid(level_columns, columns, len(rows), bytes(cells));
+
+
+def read_text(path):
+    with open(path, "rb") as f:
+        data = f.read();
+    # decode like open() in text mode would, newlines included
+    return data, data.decode().replace("\r\n", "\n").replace("\r", "\n");
+
+
+def cache_path(path):
+    folder, name = os.path.split(os.path.abspath(path));
+    return os.path.join(folder, CACHE_DIR, name + ".bin");
+
+
+def write_compiled(out, grid, info, source_digest):
+    """ write a compiled scene to a temporary file and move it over out
+
+    Other processes may have out memory-mapped (Batch.py workers share the cache), so it's
+    never truncated or written in place: they keep the old file and see a whole new one.
+    """
+    folder = os.path.dirname(out);
+    os.makedirs(folder, exist_ok=True);
+    fd, temp = tempfile.mkstemp(dir=folder, prefix=os.path.basename(out) + ".", suffix=".tmp");
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, grid.level_columns, grid.columns, grid.rows,
+                                info.st_mtime_ns, info.st_size, source_digest));
+            f.write(grid.cells);
+        os.replace(temp, out);
+    except BaseException:
+        try:
+            os.remove(temp);
+        except OSError:
+            pass;
+        raise;
+
+
+def compile_scene(path, out=None):
+    """ write the binary version of a scene and return its grid """
+    info = os.stat(path);
+    data, text = read_text(path);
+    grid = parse(text);
+    write_compiled(out or cache_path(path), grid, info, digest(data));
+    return grid;
+
+
+def read_compiled(path):
+    """ memory-map a compiled scene, returning its header and grid """
+    with open(path, "rb") as f:
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ);
+    magic, version, level_columns, columns, rows, mtime, size, source_digest = HEADER.unpack_from(view, 0);
+    if magic != MAGIC or version != VERSION or len(view) != HEADER.size + columns * rows:
+        raise ValueError("{} is not a compiled scene this version can read".format(path));
+    cells = memoryview(view)[HEADER.size:];
+    return (mtime, size, source_digest), SceneGrid(level_columns, columns, rows, cells);
+
+
+def load(path, cache=True):
+    """ the SceneGrid for a text scene, from the compiled cache when it is still fresh """
+    if not cache:
+        return parse(read_text(path)[1]);
+
+    compiled = cache_path(path);
+    info = os.stat(path);
+    try:
+        (mtime, size, source_digest), grid = read_compiled(compiled);
+    except (OSError, ValueError, struct.error):
+        grid = None;
+
+    if grid is not None:
+        if mtime == info.st_mtime_ns and size == info.st_size:
+            return grid;
+        # touched but maybe not changed, the contents decide
+        data, text = read_text(path);
+        if digest(data) == source_digest:
+            # the same scene: remember the new mtime so it isn't read and hashed again every load
+            try:
+                write_compiled(compiled, grid, info, source_digest);
+            except OSError:
+                pass;
+            return grid;
+
+    try:
+        return compile_scene(path, compiled);
+    except OSError:
+        # somewhere we can't write, just parse it every time
+        return parse(read_text(path)[1]);
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        grid = compile_scene(path);
+        print("{} -> {} ({}x{})".format(path, cache_path(path), grid.columns, grid.rows));
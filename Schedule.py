@@ -0,0 +1,77 @@
+import pygame;
+
+"""Updates entities far from the camera less often, in bigger steps."""
+
+
+# (distance from the edge of the screen in pixels, update every n ticks), nearest first.
+# the slowest rate has to keep a banana's biggest step (7 px a tick) under a tile.
+BANDS = ((0, 1), (256, 2), (1024, 4));
+
+
+class UpdateScheduler():
+
+    """ sorts entities into distance bands around the camera's view each tick
+
+    Anything on screen updates every tick. Further out an entity only updates every few ticks,
+    and then moves as far as it would have in all of them. budget caps how many of the
+    slower updates run in one tick: the rest wait for the next one and that tick counts as
+    an overrun. The numbers from the last tick are in counts, updated and deferred.
+    """
+
+    def __init__(self, bands=BANDS, budget=None):
+        self.bands = bands;
+        self.budget = budget; # most reduced-rate updates per tick, None for no limit
+        self.max_ticks = bands[-1][1]; # a deferred entity never moves more than this many ticks at once
+        self.view = pygame.Rect(0, 0, 0, 0);
+        self.tick = 0;
+        self.counts = [0] * len(bands); # entities in each band
+        self.updated = self.deferred = 0;
+        self.overruns = 0; # ticks that went over budget, since the scene loaded
+
+    def begin(self, camera, tick):
+        """ start a tick, with the world rect the camera shows """
+        self.view = camera.view;
+        self.tick = tick;
+        self.counts = [0] * len(self.bands);
+        self.updated = self.deferred = 0;
+
+    def band(self, rect):
+        """ which band a rect is in, by how far it is outside the view """
+        view = self.view;
+        distance = max(view.left - rect.right, rect.left - view.right, view.top - rect.bottom, rect.top - view.bottom);
+        band = 0;
+        for i, (start, interval) in enumerate(self.bands):
+            if distance >= start: band = i;
+        return band;
+
+    def run(self, entities, update):
+        """ call update(entity, ticks) for every entity that's due, ticks being how many passed since its last one """
+        tick, bands, counts = self.tick, self.bands, self.counts;
+        budget = self.budget;
+        spent = 0;
+        for n, entity in enumerate(entities):
+            band = self.band(entity.rect);
+            counts[band] += 1;
+            interval = bands[band][1];
+            last = getattr(entity, "last_update", None);
+            if last is None:
+                # spread a band's entities over its interval instead of updating them all together
+                last = entity.last_update = tick - 1 - n % interval;
+            ticks = tick - last;
+            if ticks < interval: continue;
+            if interval > 1:
+                if budget is not None and spent >= budget:
+                    self.deferred += 1;
+                    continue;
+                spent += 1;
+            entity.last_update = tick;
+            update(entity, min(ticks, self.max_ticks));
+            self.updated += 1;
+        if self.deferred:
+            self.overruns += 1;
+
+    def stats(self):
+        """ the last tick's numbers, by name """
+        stats = {"lod_band_{}".format(i): count for i, count in enumerate(self.counts)};
+        stats.update(lod_updated=self.updated, lod_deferred=self.deferred, lod_overruns=self.overruns);
+        return stats;
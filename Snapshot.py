@@ -0,0 +1,158 @@
+import struct;
+from collections import deque;
+from Game import rotations;
+
+"""Packs the parts of a game that change into a small binary blob and puts them back."""
+
+
+MAGIC = b"TDSS";
+VERSION = 2;
+# magic, version, tick, enemies loaded, items loaded, live bullets
+HEADER = struct.Struct("<4sBIIII");
+# x, y, x_vel, y_vel, gems, xp, level, moving | shooting << 1 | weapon_active << 2, angle, previous x, y
+PLAYER = struct.Struct("<iiddiiiBhii");
+CAMERA = struct.Struct("<ddii"); # left, top (unrounded, for smoothing), and where they were last tick
+# x, y, x_vel, y_vel, speed, active | has prev_pos << 1 | has last_update << 2, angle, previous x, y, last update
+ENEMY = struct.Struct("<iiddiBhiiq");
+BULLET = struct.Struct("<ddddiiii"); # x, y, x_vel, y_vel, target centre x, y, previous x, y
+
+
+def bits(flags):
+    """ pack a list of booleans, 8 to a byte """
+    data = bytearray((len(flags) + 7) // 8);
+    for i, flag in enumerate(flags):
+        if flag: data[i >> 3] |= 1 << (i & 7);
+    return bytes(data);
+
+
+def unbits(data, offset, count):
+    return [bool(data[offset + (i >> 3)] & 1 << (i & 7)) for i in range(count)];
+
+
+def take(env):
+    """ everything in env that changes while playing, as bytes; walls and scenery aren't in it """
+    if env.world is not None:
+        raise ValueError("streamed scenes can't be snapshotted, their bananas and items come and go");
+    if env.swarm:
+        env.swarm.push();
+    player, camera, bullets = env.player, env.camera, env.player.bullets.live;
+    enemies, items = env.enemy_list, env.item_list;
+
+    parts = [HEADER.pack(MAGIC, VERSION, env.tick, len(enemies), len(items), len(bullets))];
+    prev = player.prev_pos or player.rect.topleft;
+    parts.append(PLAYER.pack(player.rect.x, player.rect.y, player.x_vel, player.y_vel, player.gems, player.xp,
+                             player.level, player.moving | player.shooting << 1 | player.weapon_active << 2,
+                             int(player.angle), int(prev[0]), int(prev[1])));
+    parts.append(CAMERA.pack(*camera.exact, *camera.prev));
+
+    alive = [en.alive() for en in enemies];
+    parts.append(bits(alive));
+    for en, living in zip(enemies, alive):
+        if not living: continue;
+        prev, last = en.prev_pos, getattr(en, "last_update", None);
+        parts.append(ENEMY.pack(en.rect.x, en.rect.y, en.x_vel, en.y_vel, int(en.speed),
+                                en.active | (prev is not None) << 1 | (last is not None) << 2, int(en.angle),
+                                int(prev[0]) if prev else 0, int(prev[1]) if prev else 0, last or 0));
+
+    parts.append(bits([item.alive() for item in items]));
+    for bullet in bullets:
+        parts.append(BULLET.pack(bullet.x, bullet.y, bullet.x_vel, bullet.y_vel,
+                                 bullet.endrect.centerx, bullet.endrect.centery, *bullet.prev_pos));
+    return b"".join(parts);
+
+
+def restore(env, data):
+    """ put env back the way it was when take made data, without touching the static world """
+    magic, version, tick, enemy_count, item_count, bullet_count = HEADER.unpack_from(data, 0);
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a snapshot this version can read");
+    enemies, items = env.enemy_list, env.item_list;
+    if enemy_count != len(enemies) or item_count != len(items):
+        raise ValueError("the snapshot is from a different scene");
+    offset = HEADER.size;
+
+    player = env.player;
+    (x, y, player.x_vel, player.y_vel, player.gems, player.xp, player.level, flags, angle,
+     prev_x, prev_y) = PLAYER.unpack_from(data, offset);
+    offset += PLAYER.size;
+    player.moving, player.shooting, player.weapon_active = bool(flags & 1), bool(flags & 2), bool(flags & 4);
+    player.angle, player.image = angle, rotations.get(player.background, angle);
+    player.rect = player.image.get_rect(topleft=(x, y));
+    player.prev_pos = (prev_x, prev_y);
+
+    camera = env.camera;
+    left, top, prev_left, prev_top = CAMERA.unpack_from(data, offset);
+    offset += CAMERA.size;
+    camera.move_to(left, top, (prev_left, prev_top));
+
+    # back into their groups in load order, so everything updates in the same order as before
+    alive = unbits(data, offset, enemy_count);
+    offset += (enemy_count + 7) // 8;
+    env.enemies.empty();
+    env.enemy_hash.empty();
+    for en, living in zip(enemies, alive):
+        if not living: continue;
+        x, y, en.x_vel, en.y_vel, en.speed, flags, angle, prev_x, prev_y, last = ENEMY.unpack_from(data, offset);
+        offset += ENEMY.size;
+        en.rect.topleft = (x, y);
+        en.active = bool(flags & 1);
+        en.prev_pos = (prev_x, prev_y) if flags & 2 else None;
+        en.last_update = last if flags & 4 else None;
+        en.angle, en.image = angle, rotations.get(en.background, angle);
+        env.enemies.add(en);
+
+    alive = unbits(data, offset, item_count);
+    offset += (item_count + 7) // 8;
+    env.items.empty();
+    env.item_grid.empty();
+    for item, living in zip(items, alive):
+        if living:
+            env.items.add(item);
+            env.item_grid.insert(item);
+
+    pool = player.bullets;
+    pool.empty();
+    for i in range(bullet_count):
+        x, y, x_vel, y_vel, end_x, end_y, prev_x, prev_y = BULLET.unpack_from(data, offset);
+        offset += BULLET.size;
+        bullet = pool.free.pop();
+        bullet.x, bullet.y, bullet.x_vel, bullet.y_vel = x, y, x_vel, y_vel;
+        bullet.rect.x, bullet.rect.y = x, y;
+        bullet.endrect.center = (end_x, end_y);
+        bullet.prev_pos = (prev_x, prev_y);
+        bullet.live = True;
+        pool.live.append(bullet);
+
+    env.tick = tick;
+    env.running, env.result = True, None;
+    if env.swarm:
+        env.swarm.pull();
+    if env.flow:
+        env.flow.origin = None; # searched again from wherever the player is now
+
+
+class History():
+
+    """ a snapshot every few ticks, the newest capacity of them, to rewind through """
+
+    def __init__(self, every=15, capacity=120):
+        self.every = every;
+        self.snapshots = deque(maxlen=capacity); # (tick, blob), oldest first
+
+    def record(self, env):
+        """ call after every tick, it only takes a snapshot every few """
+        if env.tick % self.every == 0:
+            self.snapshots.append((env.tick, take(env)));
+
+    def rewind(self, env, ticks):
+        """ go back at least ticks ticks, or as far as the history goes; returns the tick restored to """
+        if not self.snapshots: return None;
+        target = env.tick - ticks;
+        while len(self.snapshots) > 1 and self.snapshots[-1][0] > target:
+            self.snapshots.pop();
+        tick, blob = self.snapshots[-1];
+        restore(env, blob);
+        return tick;
+
+    def clear(self):
+        self.snapshots.clear();
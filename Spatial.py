@@ -0,0 +1,120 @@
+class TileGrid():
+
+    """ spatial index for objects that never move, bucketed by the tiles they cover """
+
+    def __init__(self, size=32):
+        self.size = size;
+        self.cells = {};
+        self.count = 0;
+        self.tests = 0; # rect tests done by query, for profiling
+
+    def cells_for(self, rect):
+        """ every cell (column, row) that a rect overlaps """
+        size = self.size;
+        left, right = rect.left // size, (rect.right - 1) // size;
+        top, bottom = rect.top // size, (rect.bottom - 1) // size;
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                yield col, row;
+
+    def insert(self, obj):
+        """ add an object, remembering the order it was added in """
+        entry = (self.count, obj);
+        for cell in self.cells_for(obj.rect):
+            self.cells.setdefault(cell, []).append(entry);
+        self.count += 1;
+
+    def remove(self, obj):
+        """ take an object out of every cell it was in """
+        for cell in self.cells_for(obj.rect):
+            bucket = self.cells.get(cell);
+            if bucket:
+                bucket[:] = [entry for entry in bucket if entry[1] is not obj];
+                if not bucket: del self.cells[cell];
+
+    def empty(self):
+        self.cells.clear();
+        self.count = 0;
+
+    def query(self, rect):
+        """ (index, object) pairs overlapping rect, in the order they were added """
+        found = {};
+        cells = self.cells;
+        for cell in self.cells_for(rect):
+            bucket = cells.get(cell);
+            if bucket:
+                self.tests += len(bucket);
+                for index, obj in bucket:
+                    if rect.colliderect(obj.rect):
+                        found[index] = obj;
+        return sorted(found.items());
+
+
+class SpatialHash():
+
+    """ spatial hash for things that move, brought up to date once per tick """
+
+    def __init__(self, size=64):
+        self.size = size;
+        self.cells = {};
+        self.placed = {}; # sprite -> (index, topleft it was binned at, cells it is in)
+        self.count = 0;
+        self.sprites = ();
+        self.stale = False;
+        self.tests = 0; # rect tests done by query, for profiling
+
+    def rebuild(self, sprites):
+        """ start a new tick, the sprites are only re-binned if something queries them """
+        self.sprites = sprites;
+        self.stale = True;
+
+    def empty(self):
+        self.cells.clear();
+        self.placed.clear();
+        self.count = 0;
+
+    def bin(self):
+        """ re-bin the sprites that moved since the last tick and add any new ones """
+        self.stale = False;
+        if len(self.placed) > 2 * len(self.sprites) + 64:
+            self.empty(); # mostly dead sprites left, start over
+        size = self.size;
+        cells = self.cells;
+        placed = self.placed;
+        for spr in self.sprites:
+            rect = spr.rect;
+            old = placed.get(spr);
+            if old is not None:
+                if old[1] == rect.topleft: continue;
+                index = old[0];
+                for cell in old[2]:
+                    cells[cell].remove((index, spr));
+            else:
+                index = self.count;
+                self.count += 1;
+            entry = (index, spr);
+            covered = [(col, row) for row in range(rect.top // size, (rect.bottom - 1) // size + 1)
+                       for col in range(rect.left // size, (rect.right - 1) // size + 1)];
+            for cell in covered:
+                bucket = cells.get(cell);
+                if bucket is None:
+                    cells[cell] = [entry];
+                else:
+                    bucket.append(entry);
+            placed[spr] = (index, rect.topleft, covered);
+
+    def query(self, rect):
+        """ live sprites overlapping rect, in the order they were first binned """
+        if self.stale: self.bin();
+        size = self.size;
+        cells = self.cells;
+        found = {};
+        for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for col in range(rect.left // size, (rect.right - 1) // size + 1):
+                bucket = cells.get((col, row));
+                if bucket:
+                    self.tests += len(bucket);
+                    for index, spr in bucket:
+                        if rect.colliderect(spr.rect) and spr.alive():
+                            found[index] = spr;
+        return [found[index] for index in sorted(found)];
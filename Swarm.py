@@ -0,0 +1,226 @@
+import Scene;
+from Flow import TILE as FLOW_TILE;
+from Game import rotations, TICK;
+
+try:
+    import numpy as np;
+except ImportError:
+    np = None;
+
+"""Moves every banana at once with numpy instead of one sprite at a time."""
+
+
+TILE = Scene.TILE_SIZE;
+PAD = 2; # tiles of empty border around the solid grid, so lookups never leave it
+NEVER = -(1 << 62); # last_update for bananas the scheduler hasn't seen yet
+
+
+class EnemySwarm():
+
+    """ keeps the bananas' positions, speeds and flags in arrays and updates them in batches
+
+    The Enemy sprites stay in their group for drawing and for Bullet.collide; the swarm
+    copies positions and facing back onto the ones that moved.
+    """
+
+    def __init__(self, enemies, scene):
+        if np is None:
+            raise ImportError("the numpy enemy engine needs numpy installed");
+        self.group = enemies;
+        self.sprites = list(enemies);
+        self.count = len(self.sprites);
+
+        self.width = np.array([en.rect.width for en in self.sprites], dtype=np.float64);
+        self.height = np.array([en.rect.height for en in self.sprites], dtype=np.float64);
+        self.trigger = np.array([tuple(en.trigger_rect) for en in self.sprites], dtype=np.float64).reshape(-1, 4);
+        self.pull();
+
+        cells = np.frombuffer(bytes(scene.cells), dtype=np.uint8).reshape(scene.rows, scene.columns);
+        self.solid = np.zeros((scene.rows + 2 * PAD, scene.columns + 2 * PAD), dtype=bool);
+        self.solid[PAD:-PAD, PAD:-PAD] = (cells == Scene.WALL) | (cells == Scene.VERTICAL_WALL);
+
+    def pull(self):
+        """ (re)read everything that changes from the sprites, like after Environment.restore """
+        sprites = self.sprites;
+        self.x = np.array([en.rect.x for en in sprites], dtype=np.float64);
+        self.y = np.array([en.rect.y for en in sprites], dtype=np.float64);
+        self.x_vel = np.array([en.x_vel for en in sprites], dtype=np.float64);
+        self.y_vel = np.array([en.y_vel for en in sprites], dtype=np.float64);
+        self.speed = np.array([en.speed for en in sprites], dtype=np.float64);
+        self.active = np.array([en.active for en in sprites], dtype=bool);
+        self.alive = np.array([en.alive() for en in sprites], dtype=bool);
+        self.angle = np.array([en.angle for en in sprites], dtype=np.float64);
+        last = [getattr(en, "last_update", None) for en in sprites];
+        self.last_update = np.array([NEVER if tick is None else tick for tick in last], dtype=np.int64);
+
+    def push(self):
+        """ write back what only the arrays keep up to date, like before Environment.snapshot """
+        for en, x_vel, y_vel, last in zip(self.sprites, self.x_vel.tolist(), self.y_vel.tolist(), self.last_update.tolist()):
+            en.x_vel, en.y_vel = x_vel, y_vel;
+            en.last_update = None if last == NEVER else last;
+
+    def sync_alive(self):
+        """ notice bananas that were killed outside the swarm (by bullets) """
+        if len(self.group) != int(self.alive.sum()):
+            self.alive = np.array([en.alive() for en in self.sprites], dtype=bool);
+
+    def is_solid(self, cols, rows):
+        rows = np.clip(rows + PAD, 0, self.solid.shape[0] - 1);
+        cols = np.clip(cols + PAD, 0, self.solid.shape[1] - 1);
+        return self.solid[rows, cols];
+
+    def collide_x(self, idx):
+        """ push bananas that moved sideways into a wall back out, like Entity.wall_collide """
+        x, y, vel = self.x[idx], self.y[idx], self.x_vel[idx];
+        top = np.floor_divide(y, TILE).astype(np.int64);
+        bottom = np.floor_divide(y + self.height[idx] - 1, TILE).astype(np.int64);
+        right = vel > 0;
+        col = np.where(right, np.floor_divide(x + self.width[idx] - 1, TILE),
+                       np.floor_divide(x, TILE)).astype(np.int64);
+        hit = (vel != 0) & (self.is_solid(col, top) | self.is_solid(col, bottom));
+        self.x[idx] = np.where(hit, np.where(right, col * TILE - self.width[idx], (col + 1) * TILE), x);
+
+    def collide_y(self, idx):
+        x, y, vel = self.x[idx], self.y[idx], self.y_vel[idx];
+        left = np.floor_divide(x, TILE).astype(np.int64);
+        right = np.floor_divide(x + self.width[idx] - 1, TILE).astype(np.int64);
+        down = vel > 0;
+        row = np.where(down, np.floor_divide(y + self.height[idx] - 1, TILE),
+                       np.floor_divide(y, TILE)).astype(np.int64);
+        hit = (vel != 0) & (self.is_solid(left, row) | self.is_solid(right, row));
+        self.y[idx] = np.where(hit, np.where(down, row * TILE - self.height[idx], (row + 1) * TILE), y);
+
+    def facing(self, dx, dy):
+        """ get_angle for a whole array """
+        angle = -np.degrees(np.arctan2(dy, dx));
+        angle = np.where(angle < 0, angle + 360, angle);
+        return np.select([(45 < angle) & (angle <= 135), (135 < angle) & (angle <= 225),
+                          (225 < angle) & (angle <= 315), ((315 < angle) & (angle <= 360)) | ((0 <= angle) & (angle <= 45))],
+                         [90, 180, 270, 0], angle);
+
+    def steer(self, movers, target, field):
+        """ where each mover is headed relative to: the player, or the flow field's next tile
+
+        Also returns which movers follow the field (None for none of them) and the top left
+        of their next tile, which they move onto like Enemy.follow.
+        """
+        px, py = target.rect.topleft;
+        dx = self.x[movers] - px;
+        dy = self.y[movers] - py;
+        if field is None:
+            return dx, dy, None, None, None;
+        field.refresh();
+        if field.origin is None:
+            return dx, dy, None, None, None;
+
+        cx = self.x[movers] + self.width[movers] // 2;
+        cy = self.y[movers] + self.height[movers] // 2;
+        col = np.floor_divide(cx, FLOW_TILE).astype(np.int64);
+        row = np.floor_divide(cy, FLOW_TILE).astype(np.int64);
+        inside = (col >= 0) & (col < field.columns) & (row >= 0) & (row < field.rows);
+        i = np.where(inside, row * field.columns + col, 0);
+        step_x = np.frombuffer(field.step_x, dtype=np.int8)[i];
+        step_y = np.frombuffer(field.step_y, dtype=np.int8)[i];
+        reached = np.frombuffer(field.reached, dtype=np.uint8)[i].astype(bool) & inside;
+        next_col, next_row = col + step_x, row + step_y;
+        # same rule as FlowField.waypoint: next to the player, go straight at them
+        follow = reached & ~((next_col == field.origin[0]) & (next_row == field.origin[1]));
+        goal_x, goal_y = next_col * FLOW_TILE, next_row * FLOW_TILE;
+        dx = np.where(follow, self.x[movers] - goal_x, dx);
+        dy = np.where(follow, self.y[movers] - goal_y, dy);
+        return dx, dy, follow, goal_x, goal_y;
+
+    def toward(self, pos, goal, step):
+        """ Game.toward for arrays """
+        step = np.maximum(1, step);
+        return np.where(pos < goal, np.minimum(goal, pos + step), np.where(pos > goal, np.maximum(goal, pos - step), pos));
+
+    def schedule(self, movers, scheduler):
+        """ Schedule.UpdateScheduler.run for arrays: the movers that are due and how many ticks each one moves """
+        view, tick, bands = scheduler.view, scheduler.tick, scheduler.bands;
+        x, y = self.x[movers], self.y[movers];
+        distance = np.maximum.reduce([view.left - (x + self.width[movers]), x - view.right,
+                                      view.top - (y + self.height[movers]), y - view.bottom]);
+        band = np.zeros(len(movers), dtype=np.int64);
+        for i, (start, interval) in enumerate(bands):
+            band[distance >= start] = i;
+        interval = np.array([interval for start, interval in bands])[band];
+        for i, count in enumerate(np.bincount(band, minlength=len(bands)).tolist()):
+            scheduler.counts[i] += count;
+
+        last = self.last_update[movers];
+        fresh = last == NEVER;
+        last = np.where(fresh, tick - 1 - np.arange(len(movers)) % interval, last);
+        ticks = tick - last;
+        due = ticks >= interval;
+        if scheduler.budget is not None:
+            slow = np.flatnonzero(due & (interval > 1));
+            late = slow[scheduler.budget:];
+            due[late] = False;
+            scheduler.deferred += len(late);
+            if len(late): scheduler.overruns += 1;
+        self.last_update[movers] = np.where(due, tick, last);
+        scheduler.updated += int(due.sum());
+        return movers[due], np.minimum(ticks[due], scheduler.max_ticks);
+
+    def update(self, target, field=None, dt=TICK, scheduler=None):
+        """ one tick for every banana: move the active ones, hit the player, wake up the rest
+
+        With a Schedule.UpdateScheduler, bananas far from the screen move less often and further.
+        """
+        self.sync_alive();
+        px, py, pw, ph = target.rect;
+
+        movers = np.flatnonzero(self.alive & self.active);
+        step = dt;
+        if scheduler is not None and len(movers):
+            movers, ticks = self.schedule(movers, scheduler);
+            step = dt * ticks;
+        if len(movers):
+            dx, dy, follow, goal_x, goal_y = self.steer(movers, target, field);
+            angle = self.facing(dx, dy);
+            distance = np.hypot(dx, dy);
+            moving = distance > 0;
+            safe = np.where(moving, distance, 1);
+            self.x_vel[movers] = np.where(moving, -(dx / safe) * self.speed[movers], self.x_vel[movers]);
+            self.y_vel[movers] = np.where(moving, -(dy / safe) * self.speed[movers], self.y_vel[movers]);
+
+            before = zip(self.x[movers].tolist(), self.y[movers].tolist());
+            # pygame rounds when a float lands in a Rect
+            x = self.x[movers] + self.x_vel[movers] * step;
+            if follow is not None:
+                x = np.where(follow, self.toward(self.x[movers], goal_x, np.abs(self.x_vel[movers] * step)), x);
+            self.x[movers] = np.rint(x);
+            self.collide_x(movers);
+            y = self.y[movers] + self.y_vel[movers] * step;
+            if follow is not None:
+                y = np.where(follow, self.toward(self.y[movers], goal_y, np.abs(self.y_vel[movers] * step)), y);
+            self.y[movers] = np.rint(y);
+            self.collide_y(movers);
+
+            hits = ((self.x[movers] < px + pw) & (px < self.x[movers] + self.width[movers]) &
+                    (self.y[movers] < py + ph) & (py < self.y[movers] + self.height[movers]));
+
+            sprites = self.sprites;
+            turned = angle != self.angle[movers];
+            self.angle[movers] = angle;
+            for i, en_x, en_y, hit, turn, a, prev in zip(movers.tolist(), self.x[movers].tolist(), self.y[movers].tolist(),
+                                                         hits.tolist(), turned.tolist(), angle.tolist(), before):
+                en = sprites[i];
+                en.prev_pos = prev;
+                en.rect.x, en.rect.y = en_x, en_y;
+                if turn:
+                    en.angle = a;
+                    en.image = rotations.get(en.background, a);
+                if hit:
+                    target.xp -= 20;
+                    en.kill();
+                    self.alive[i] = False;
+
+        sleeping = np.flatnonzero(self.alive & ~self.active);
+        if len(sleeping):
+            tx, ty, tw, th = self.trigger[sleeping].T;
+            woken = sleeping[(tx < px + pw) & (px < tx + tw) & (ty < py + ph) & (py < ty + th)];
+            self.active[woken] = True;
+            for i in woken.tolist():
+                self.sprites[i].active = True;
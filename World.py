@@ -0,0 +1,245 @@
+import threading, queue, random, math;
+import pygame;
+import Scene;
+from Game import Enemy, Item, Scenery, Wall, TICK_RATE;
+from Render import bake_chunk;
+
+"""Streams big scenes in and out in chunks around the camera, building them on a background thread."""
+
+
+TILE = Scene.TILE_SIZE;
+
+
+class ChunkData():
+
+    """ the walls, scenery, baked image and spawn points of one chunk, built off the main thread """
+
+    def __init__(self, key, rect):
+        self.key = key;
+        self.rect = rect;
+        self.walls = [];
+        self.spawns = []; # (tile, tile index, pos) for items and bananas, made into sprites on the main thread
+        self.chunk = None; # a Render.Chunk once it's baked
+        self.items = []; # (tile index, Item) while the chunk is in the world
+
+
+class StreamingWorld():
+
+    """ keeps only the chunks around the camera in memory, loading the rest as the camera moves
+
+    Chunks the camera can see (plus margin chunks around them) are needed now and are waited
+    for if the loader hasn't finished them; the next prefetch rings are loaded in the background
+    and held until they're needed. At most budget chunks are kept in the world, the ones nobody
+    wants and then the furthest go first; if the chunks needed right now don't fit, they're all
+    kept anyway and over_budget counts the ticks that happened.
+    Bananas standing in a chunk when it goes are put to sleep with it and woken when it comes
+    back, picked up items and dead bananas stay gone. Only chunks that are needed ever join
+    the world, and what leaves it only depends on what's in it and where the camera is, so the
+    game plays the same however fast the loader is. Prefetching stops at the budget, so nothing
+    it loads gets evicted again while the camera holds still.
+
+    It takes the place of the static layer: chunks lists the baked images of the loaded chunks.
+    """
+
+    def __init__(self, env, scene, chunk_size=512, budget=64, margin=1, prefetch=2):
+        if chunk_size % TILE:
+            raise ValueError("chunk_size has to be a whole number of tiles");
+        self.env = env;
+        self.scene = scene;
+        self.chunk_size = chunk_size;
+        self.tiles = chunk_size // TILE;
+        self.columns = math.ceil(scene.columns / self.tiles);
+        self.rows = math.ceil(scene.rows / self.tiles);
+        self.budget = budget;
+        self.margin, self.prefetch = margin, prefetch;
+        self.seed = env.rng_seed;
+
+        self.resident = {}; # key -> ChunkData in the world
+        self.chunks = []; # their Render.Chunks, for the renderer
+        self.gone = set(); # tile indices of items picked up and bananas spawned (alive ones travel as sprites)
+        self.dormant = {}; # key -> saved bananas that were standing in it when it unloaded
+        self.wanted = frozenset();
+        self.loads = self.unloads = self.waits = 0;
+        self.over_budget = 0; # ticks the needed chunks alone were more than the budget
+
+        self.lock = threading.Condition();
+        self.ready = {}; # key -> ChunkData built by the loader, not in the world yet
+        self.pending = set(); # keys the loader has been asked for
+        self.requests = queue.Queue();
+        self.thread = threading.Thread(target=self.work, name="chunk loader", daemon=True);
+        self.thread.start();
+
+    def key_for(self, x, y):
+        return int(x) // self.chunk_size, int(y) // self.chunk_size;
+
+    def keys_around(self, view, rings):
+        """ every chunk overlapping view grown by rings chunks, nearest first """
+        size = self.chunk_size;
+        area = view.inflate(2 * rings * size, 2 * rings * size);
+        left, top = max(0, area.left // size), max(0, area.top // size);
+        right, bottom = min(self.columns - 1, (area.right - 1) // size), min(self.rows - 1, (area.bottom - 1) // size);
+        cx, cy = view.centerx / size, view.centery / size;
+        keys = [(col, row) for row in range(top, bottom + 1) for col in range(left, right + 1)];
+        keys.sort(key=lambda key: (key[0] + 0.5 - cx) ** 2 + (key[1] + 0.5 - cy) ** 2);
+        return keys;
+
+    def work(self):
+        """ the loader thread: build whatever is asked for unless nobody wants it anymore """
+        while True:
+            key = self.requests.get();
+            if key is None: return;
+            try:
+                data = self.build(key) if key in self.wanted else None;
+            except Exception as e:
+                data = e; # raised on the main thread when the chunk is needed
+            with self.lock:
+                self.pending.discard(key);
+                if data is not None:
+                    self.ready[key] = data;
+                self.lock.notify_all();
+
+    def build(self, key):
+        """ read a chunk's tiles from the scene and bake its static image """
+        col, row = key;
+        env, scene, tiles = self.env, self.scene, self.tiles;
+        rect = pygame.Rect(col * self.chunk_size, row * self.chunk_size, self.chunk_size, self.chunk_size);
+        rect = rect.clip(0, 0, scene.columns * TILE, scene.rows * TILE);
+        data = ChunkData(key, rect);
+        statics = [];
+        for y in range(row * tiles, min(scene.rows, (row + 1) * tiles)):
+            line = scene.row(y);
+            for x in range(col * tiles, min(scene.columns, (col + 1) * tiles)):
+                tile = line[x];
+                if not tile: continue;
+                pos = (x * TILE, y * TILE);
+                if tile in (Scene.WALL, Scene.VERTICAL_WALL):
+                    wall = Wall(pos, env.wall_image, "horizontal" if tile == Scene.WALL else "vertical");
+                    data.walls.append(wall);
+                    statics.append(wall);
+                elif tile == Scene.BUSH:
+                    statics.append(Scenery(pos, env.bush_image));
+                elif tile == Scene.WATER:
+                    statics.append(Scenery(pos, env.water_image));
+                else:
+                    data.spawns.append((tile, y * scene.columns + x, pos));
+        data.chunk = bake_chunk(env.background_tile, rect, statics);
+        return data;
+
+    def request(self, key):
+        """ ask the loader for a chunk unless it's already loaded or on its way; call with the lock held """
+        if key in self.resident or key in self.ready or key in self.pending: return;
+        self.pending.add(key);
+        self.requests.put(key);
+
+    def update(self, camera):
+        """ follow the camera: bring in the chunks around it and drop the furthest ones over budget """
+        view = camera.view;
+        needed = self.keys_around(view, self.margin);
+        # the nearest prefetch chunks that fit in the budget alongside the needed ones
+        close = set(needed);
+        wanted = needed + [key for key in self.keys_around(view, self.margin + self.prefetch)
+                           if key not in close][:max(0, self.budget - len(needed))];
+        self.wanted = frozenset(wanted);
+
+        missing = [key for key in needed if key not in self.resident];
+        with self.lock:
+            for key in wanted:
+                self.request(key);
+            arrived = [];
+            for key in missing:
+                if key not in self.ready:
+                    self.waits += 1;
+                    while key not in self.ready:
+                        self.request(key); # it was dropped while nobody wanted it
+                        self.lock.wait();
+                arrived.append(self.ready.pop(key));
+        for data in arrived:
+            if isinstance(data, Exception): raise data;
+            self.add(data);
+
+        with self.lock:
+            # built but never joined the world, and not wanted anymore: just forget them
+            for key in [key for key in self.ready if key not in self.wanted]:
+                del self.ready[key];
+        if len(needed) > self.budget:
+            self.over_budget += 1;
+        if len(self.resident) > self.budget:
+            self.evict(set(needed));
+
+    def evict(self, needed):
+        """ unload chunks from the world until the budget is met, never the needed ones
+
+        Only the chunks in the world count, not the ones the loader has finished, so this
+        never depends on how far the loader has got.
+        """
+        px, py = self.key_for(*self.env.player.rect.center);
+        candidates = [key for key in self.resident if key not in needed];
+        # chunks nobody wants anymore first, then the furthest
+        candidates.sort(key=lambda key: (key not in self.wanted, (key[0] - px) ** 2 + (key[1] - py) ** 2),
+                        reverse=True);
+        unloaded = candidates[:len(self.resident) - self.budget];
+        for key in unloaded:
+            self.remove(self.resident[key]);
+        if unloaded:
+            self.park();
+
+    def add(self, data):
+        """ put a built chunk into the world: walls in the grid, items and bananas as sprites """
+        env = self.env;
+        for wall in data.walls:
+            env.wall_grid.insert(wall);
+        for tile, index, pos in data.spawns:
+            if index in self.gone: continue;
+            if tile == Scene.ENEMY:
+                # the same speed whenever this banana first shows up
+                speed = random.Random(self.seed * 1000003 + index).randint(3, 7) * TICK_RATE;
+                Enemy([env.enemies], pos, env.enemy_image, speed);
+                self.gone.add(index);
+            else:
+                item = self.make_item(tile, pos);
+                env.item_grid.insert(item);
+                data.items.append((index, item));
+        for x, y, speed, active, x_vel, y_vel in self.dormant.pop(data.key, ()):
+            en = Enemy([env.enemies], (x, y), env.enemy_image, speed);
+            en.active, en.x_vel, en.y_vel = active, x_vel, y_vel;
+
+        self.resident[data.key] = data;
+        self.chunks.append(data.chunk);
+        self.loads += 1;
+
+    def make_item(self, tile, pos):
+        env = self.env;
+        if tile == Scene.GEM:
+            return Item([env.items], pos, env.gem_image, env.player.increase_gems);
+        if tile == Scene.GUN:
+            return Item([env.items], pos, env.gun_image, env.player.activate_weapon);
+        return Item([env.items], pos, env.exit_image, env.end_game, False);
+
+    def remove(self, data):
+        """ take a chunk out of the world """
+        env = self.env;
+        for wall in data.walls:
+            env.wall_grid.remove(wall);
+        for index, item in data.items:
+            if item.alive():
+                env.item_grid.remove(item);
+                item.kill();
+            else:
+                self.gone.add(index);
+        data.items = [];
+        del self.resident[data.key];
+        self.chunks.remove(data.chunk);
+        self.unloads += 1;
+
+    def park(self):
+        """ put every banana that isn't standing in a loaded chunk to sleep with the chunk it's in """
+        for en in self.env.enemies.sprites():
+            key = self.key_for(*en.rect.center);
+            if key not in self.resident:
+                self.dormant.setdefault(key, []).append((en.rect.x, en.rect.y, en.speed, en.active, en.x_vel, en.y_vel));
+                en.kill();
+
+    def close(self):
+        """ stop the loader thread """
+        self.wanted = frozenset();
+        self.requests.put(None);
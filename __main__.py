@@ -1,170 +1,382 @@
-import pygame, math, sys;
+import pygame, sys, os, time, random, argparse;
 from Button import Button;
 from Control import Camera;
-from Game import Player, Enemy, Item, Scenery, Wall;
+from Render import Renderer, DirtyRenderer, PipelinedRenderer, StaticLayer;
+from Game import Player, Enemy, Item, Scenery, Wall, rotations, TICK_RATE;
+from Spatial import TileGrid, SpatialHash;
+from Replay import Recorder, Replayer, settings;
+from Perf import FrameProfiler;
+import Scene;
+from Swarm import EnemySwarm;
+from Flow import FlowField;
+from Assets import AssetManager;
+from World import StreamingWorld;
+from Schedule import UpdateScheduler;
+import Snapshot;
 
 
 WIN_WIDTH = 800;
 WIN_HEIGHT = 600;
+MAX_STEPS = 5; # ticks caught up per frame before the game gives in and slows down
+# every image the game uses, loaded as self.<name>_image
+IMAGES = {"player": "player.png", "bush": "bush.png", "cursor": "cursor.png", "wall": "wall.png",
+          "gem": "gem.png", "enemy": "banenemy.png", "bullet": "bullet.png", "gun": "gun.png",
+          "exit": "door.png", "background": "background1.png"};
 
 
 class Environment():
 
     """ The main class that controls the entire game """
 
-    def __init__(self):
-        self.entities = pygame.sprite.Group();
-        self.walls = pygame.sprite.Group();
+    def __init__(self, headless=False, seed=None):
+        self.headless = headless;
+        self.seed = seed; # None picks a new one every time a scene is set up
+        self.result = None;
+        self.recorder = None;
+        self.profiler = None;
+        self.scene_cache = True; # load scenes through the compiled cache in Scene.py
+        self.enemy_engine = "sprites"; # or "numpy" to move the bananas with Swarm.EnemySwarm
+        self.swarm = None;
+        self.pathfinding = True; # bananas follow a Flow.FlowField around walls
+        self.flow = None;
+        self.assets = AssetManager();
+        self.streaming = False; # load the scene a chunk at a time around the camera, see World.py
+        self.chunk_budget = 64; # most chunks kept in memory while streaming
+        self.world = None;
+        self.lod = False; # update bananas far from the screen less often, see Schedule.py
+        self.lod_budget = None; # most reduced-rate banana updates per tick
+        self.scheduler = None;
+        self.tick = 0;
+        self.dirty_rects = False; # redraw only what changed while the camera holds still, see Render.DirtyRenderer
+        self.pipelined = False; # blit and flip on a render thread, see Render.PipelinedRenderer
+        self.renderer = None;
+        self.camera_smoothing = 0.0; # 0 keeps the player centred, up to 1 for a lazier camera (replays need the same)
+        self.history = None; # a Snapshot.History to rewind through
+        self.start = None; # snapshot of the scene as it loaded, for restart
+
+        # static: never move or change, only drawn (baked into the static layer) and collided with
+        self.walls = [];
+        self.statics = []; # walls and scenery, Game.Tile records rather than sprites
+        self.wall_grid = TileGrid(32);
+        # interactive: sit still until the player touches them, found through item_grid
+        self.items = pygame.sprite.Group();
+        self.item_grid = TileGrid(32);
+        # dynamic: updated every tick (along with the player and their bullets)
         self.enemies = pygame.sprite.Group();
+        self.enemy_hash = SpatialHash(64);
+        # every banana and item the scene loaded, dead or alive, in load order for snapshots
+        self.enemy_list = [];
+        self.item_list = [];
         
         self.clock = pygame.time.Clock();
-        self.fps = 30;
+        self.tick_rate = TICK_RATE; # the simulation always runs at this many ticks per second
+        self.fps = 60; # frames drawn per second, 0 for as many as possible
         self.running = False;
 
     def load_images(self):
         """ loads all the image files """
-        # dont forget to convert them when you load them
-        self.player_image = pygame.image.load("IMAGES\\player.png").convert_alpha();
-        self.bush_image = pygame.image.load("IMAGES\\bush.png").convert_alpha();
-        self.cursor_image = pygame.image.load("IMAGES\\cursor.png").convert_alpha();
-        self.wall_image = pygame.image.load("IMAGES\\wall.png").convert_alpha();
-        self.gem_image = pygame.image.load("IMAGES\\gem.png").convert_alpha();
-        self.enemy_image = pygame.image.load("IMAGES\\banenemy.png").convert_alpha();
-        self.bullet_image = pygame.image.load("IMAGES\\bullet.png").convert_alpha();
-        self.gun_image = pygame.image.load("IMAGES\\gun.png").convert_alpha();
-        self.exit_image = pygame.image.load("IMAGES\\door.png").convert();
-        self.background_image = self.stitch(pygame.transform.scale(pygame.image.load("IMAGES\\background1.png").convert(), (32, 32)),
-                                            self.level_width, self.level_height);
-        self.water_image = pygame.Surface((32, 32));
+        # the atlas (and the disk cache behind it) converts them, and a reload reuses them
+        if not self.assets.images:
+            self.assets.load(IMAGES, opaque=("exit", "background"));
+        for name, image in self.assets.images.items():
+            setattr(self, name + "_image", image);
+        self.background_tile = pygame.transform.scale(self.background_image, (32, 32));
+        self.water_image = pygame.Surface((32, 32)).convert();
         self.water_image.fill((0, 64, 255));
 
+        # the player and the bananas only ever face one of four directions
+        rotations.add(self.player_image);
+        rotations.add(self.enemy_image);
+        rotations.add(self.wall_image, (90,));
+
     def load_scene(self, file, clear=True):
-        """ reads a text file with a level in it """
+        """ reads a text file with a level in it (compiled and cached by Scene.load) """
         if clear:
-            self.entities.empty();
-            self.walls.empty();
+            self.walls.clear();
+            self.statics.clear();
+            self.items.empty();
             self.enemies.empty();
-        x, y = 0, 0;
-        with open(file) as f:
-            for row in f:
-                for col in row:
-                    if col in "1H":
-                        Wall([self.entities, self.walls], (x, y), self.wall_image);
-                    elif col in "2V":
-                        Wall([self.entities, self.walls], (x, y), self.wall_image, "vertical");
-                    elif col in "3B":
-                        Scenery([self.entities], (x, y), self.bush_image);
-                    elif col in "4W":
-                        Scenery([self.entities], (x, y), self.water_image);
-                    elif col in "5G":
-                        Item([self.entities], (x, y), self.gem_image, self.player.increase_gems);
-                    elif col in "6E":
-                        Enemy([self.enemies], (x, y), self.enemy_image);
-                    elif col in "7D":
-                        Item([self.entities], (x, y), self.exit_image, self.end_game, False);
-                    elif col in "8S":
-                        Item([self.entities], (x, y), self.gun_image, self.player.activate_weapon)
-                    x += 32;
-                y += 32;
-                x = 0;
+            self.wall_grid.empty();
+            self.item_grid.empty();
+            self.enemy_hash.empty();
+            self.enemy_list.clear();
+            self.item_list.clear();
+            if self.world: self.world.close();
+            self.world = None;
+        self.scene = Scene.load(file, self.scene_cache);
+
+        if self.streaming:
+            # the numpy engine wants every banana up front, streamed ones come and go
+            self.swarm = None;
+            self.flow = FlowField(self.scene) if self.pathfinding else None;
+            self.scheduler = UpdateScheduler(budget=self.lod_budget) if self.lod else None;
+            self.world = self.static_layer = StreamingWorld(self, self.scene, budget=self.chunk_budget);
+            self.world.update(self.camera);
+            return;
+
+        def add_wall(wall):
+            self.walls.append(wall);
+            self.statics.append(wall);
+            self.wall_grid.insert(wall);
+
+        def add_item(*args):
+            item = Item([self.items], *args);
+            self.item_list.append(item);
+            self.item_grid.insert(item);
+
+        builders = {
+            Scene.WALL: lambda pos: add_wall(Wall(pos, self.wall_image)),
+            Scene.VERTICAL_WALL: lambda pos: add_wall(Wall(pos, self.wall_image, "vertical")),
+            Scene.BUSH: lambda pos: self.statics.append(Scenery(pos, self.bush_image)),
+            Scene.WATER: lambda pos: self.statics.append(Scenery(pos, self.water_image)),
+            Scene.GEM: lambda pos: add_item(pos, self.gem_image, self.player.increase_gems),
+            Scene.ENEMY: lambda pos: self.enemy_list.append(Enemy([self.enemies], pos, self.enemy_image)),
+            Scene.DOOR: lambda pos: add_item(pos, self.exit_image, self.end_game, False),
+            Scene.GUN: lambda pos: add_item(pos, self.gun_image, self.player.activate_weapon),
+        };
+        for y in range(self.scene.rows):
+            for x, tile in enumerate(self.scene.row(y)):
+                if tile:
+                    builders[tile]((x * 32, y * 32));
+
+        self.swarm = EnemySwarm(self.enemies, self.scene) if self.enemy_engine == "numpy" else None;
+        self.flow = FlowField(self.scene) if self.pathfinding else None;
+        self.scheduler = UpdateScheduler(budget=self.lod_budget) if self.lod else None;
+
+        # the static layer covers at least the whole window, like the old stitched background did
+        self.static_layer = StaticLayer(max(WIN_WIDTH, self.level_width), max(WIN_HEIGHT, self.level_height));
+        self.static_layer.bake(self.background_tile, self.statics);
 
     def get_scene_dimensions(self, file):
-        with open(file) as f:
-            lines = f.readlines();
-            width = 32 * (len(lines[0]) - 1); # - 1 because of newline character
-            height = 32 * len(lines);
-            del lines;
-        return width, height
-
-    def stitch(self, image, total_width, total_height):
-        """ Repeats an image so it fills the whole screen """
-        total_width = max(800, total_width);
-        total_height = max(600, total_height);
-        x, y = 0, 0;
-        *_, iwidth, iheight = image.get_rect();
-        x_num = math.ceil(total_width / iwidth);
-        y_num = math.ceil(total_height / iheight);
-        background = pygame.Surface((total_width, total_height), pygame.SRCALPHA, 32);
-
-        for i in range(y_num):
-            for i2 in range(x_num):
-                background.blit(image, (x, y));
-                x += iwidth;
-            y += iheight;
-            x = 0;
-
-        return background;
+        return Scene.load(file, self.scene_cache).dimensions;
+
+    def stats(self):
+        """ the numbers that get printed when the game ends """
+        return {"xp": self.player.xp, "level": self.player.level, "gems": self.player.gems};
 
     def end_game(self, b=True, error=None):
         """ ends the game, exits the program, prints the results """
-        pygame.quit();
         self.running = False;
-        if b: print("Player XP: {}\nPlayer Level: {}\nPlayer Gems: {}".format(self.player.xp, self.player.level, self.player.gems));
+        self.result = self.stats();
+        if self.profiler: self.profiler.close();
+        if self.renderer: self.renderer.close();
+        if self.headless:
+            # headless runs hand the results back to simulate instead of exiting
+            if error: raise error;
+            return;
+        if self.recorder: self.recorder.save();
+        pygame.quit();
+        if b: print("Player XP: {xp}\nPlayer Level: {level}\nPlayer Gems: {gems}".format(**self.result));
         if error: raise error;
         sys.exit();
 
-    def run(self, scene, title="game"):
-        """ runs the game! """
+    def setup(self, scene, title="game"):
+        """ opens the window and loads the images and the scene """
+        if self.headless:
+            # has to be set before the display starts up
+            os.environ["SDL_VIDEODRIVER"] = "dummy";
         pygame.init();
         self.running = True;
+        self.tick = 0;
+        self.result = None;
+
+        # the bananas get random speeds, so seed that before the scene loads
+        self.rng_seed = random.randrange(1 << 32) if self.seed is None else self.seed;
+        random.seed(self.rng_seed);
 
         self.level_width, self.level_height = self.get_scene_dimensions(scene);
+        # a render thread can still be drawing on the old window, finish it first
+        if self.renderer: self.renderer.close();
         self.window = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT));
-        self.camera = Camera(self.level_width, self.level_height, WIN_WIDTH, WIN_HEIGHT);
-        pygame.display.set_caption(title);
-        pygame.key.set_repeat(100, 50);
+        self.camera = Camera(self.level_width, self.level_height, WIN_WIDTH, WIN_HEIGHT, self.camera_smoothing);
+        if self.pipelined:
+            self.renderer = PipelinedRenderer(self.camera);
+        else:
+            self.renderer = DirtyRenderer(self.camera) if self.dirty_rects else Renderer(self.camera);
+        if not self.headless:
+            pygame.display.set_caption(title);
+            pygame.key.set_repeat(100, 50);
+            pygame.mouse.set_visible(False);
 
-        pygame.mouse.set_visible(False);
         self.load_images();
-        
-        self.player = Player([], (100, 100), self.player_image);
+
+        self.player = Player([], (100, 100), self.player_image, self.bullet_image);
+        self.player.bullets.bounds = pygame.Rect(0, 0, self.level_width, self.level_height);
         self.load_scene(scene);
+        self.start = Snapshot.take(self) if not self.world else None;
+        if self.history: self.history.clear();
+
+    def handle_events(self):
+        """ turn keyboard events into player input """
+        for event in pygame.event.get():
+
+            if event.type == pygame.QUIT:
+                self.running = False;
+                break;
+
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False;
+                    break;
+                elif event.key == pygame.K_UP:
+                    self.player.moving = True;
+                elif event.key == pygame.K_SPACE:
+                    self.player.shooting = True
+                elif event.key == pygame.K_BACKSPACE and self.history and not self.recorder:
+                    self.history.rewind(self, 3 * self.tick_rate);
+                elif event.key == pygame.K_F5 and self.start and not self.recorder:
+                    self.restart();
+
+            elif event.type == pygame.KEYUP:
+                if event.key == pygame.K_UP:
+                    self.player.moving = False
+                elif event.key == pygame.K_SPACE:
+                    self.player.shooting = False;
+
+    def snapshot(self):
+        """ the state of the game right now as a compact bytes blob, see Snapshot.py """
+        return Snapshot.take(self);
+
+    def restore(self, data):
+        """ go back to a snapshot of this scene, the walls and scenery stay as they are """
+        Snapshot.restore(self, data);
+
+    def restart(self):
+        """ back to how the scene was when it loaded, without loading it again """
+        self.restore(self.start);
+        if self.history: self.history.clear();
+
+    def enable_rewind(self, every=15, capacity=120):
+        """ keep a snapshot every few ticks (by default every half second for the last minute) """
+        self.history = Snapshot.History(every, capacity);
+
+    def enable_profiling(self, overlay=False, trace=None):
+        """ time every phase of the main loop, optionally on screen and/or to a CSV file """
+        self.profiler = FrameProfiler(overlay, trace);
+
+    def pick_up(self):
+        """ let the items the player is standing on do their thing """
+        for index, item in self.item_grid.query(self.player.rect):
+            item.update(self.player);
+            if not item.alive():
+                self.item_grid.remove(item);
+
+    def step(self, mouse_pos):
+        """ advance the game by one tick, mouse_pos is in screen coordinates """
+        prof = self.profiler;
+        if prof: prof.begin();
+        dt = 1 / self.tick_rate;
+        self.tick += 1;
+
+        self.enemy_hash.rebuild(self.enemies);
+        if prof: prof.mark("hash");
+        self.player.update(self.wall_grid, self.camera.reverse(mouse_pos), dt);
+        if prof: prof.mark("player");
+        self.player.bullets.update(self.enemy_hash, self.player, dt);
+        if prof: prof.mark("bullets");
+        if self.flow:
+            self.flow.update(self.player.rect);
+            if prof: prof.mark("flow");
+        if self.scheduler:
+            self.scheduler.begin(self.camera, self.tick);
+        if self.swarm:
+            self.swarm.update(self.player, self.flow, dt, self.scheduler);
+        elif self.scheduler:
+            walls, player, flow = self.wall_grid, self.player, self.flow;
+            # only moving bananas are scheduled, sleeping ones look for the player every tick (like the swarm)
+            enemies = self.enemies.sprites();
+            self.scheduler.run([en for en in enemies if en.active], lambda en, ticks: en.update(walls, player, flow, dt * ticks));
+            for en in enemies:
+                if not en.active: en.update(walls, player, flow, dt);
+        else:
+            self.enemies.update(self.wall_grid, self.player, self.flow, dt);
+        if prof: prof.mark("enemies");
+        self.pick_up();
+        if prof: prof.mark("items");
+        self.camera.update(self.player);
+        if self.world:
+            self.world.update(self.camera);
+            if prof: prof.mark("world");
+
+        self.player.shoot(self.camera.reverse(mouse_pos));
+        if prof: prof.mark("shoot");
+        if self.history and not self.world:
+            self.history.record(self);
+            if prof: prof.mark("snapshot");
+
+    def render(self, mouse_pos, alpha=1.0):
+        """ draw everything and flip the display, alpha of the way from the last tick to this one """
+        prof = self.profiler;
+        if prof: prof.begin();
+        overlays = [(self.cursor_image, (mouse_pos[0]-5, mouse_pos[1]-5))];
+        if prof and self.renderer.threaded:
+            overlays += prof.blits(); # the render thread has the window, so the numbers go in its draw list
+        # items and bananas come from their spatial indexes instead of testing every one against the view
+        self.enemy_hash.rebuild(self.enemies);
+        tests = self.enemy_hash.tests; # collision_tests is about the game, not the drawing
+        items = lambda view: [item for index, item in self.item_grid.query(view)];
+        self.renderer.draw(self.window, (self.static_layer.chunks, items, self.enemy_hash.query,
+                                         self.player.bullets, (self.player,)), alpha, overlays);
+        self.enemy_hash.tests = tests;
+        if prof:
+            prof.mark("blit");
+            if not self.renderer.threaded:
+                self.renderer.touch(prof.draw(self.window));
+        self.renderer.present();
+        if prof: prof.mark("flip");
+
+    def end_frame(self):
+        """ close off the profiler's frame, once per frame after its ticks and the render """
+        prof = self.profiler;
+        if not prof: return;
+        prof.count("live_bullets", len(self.player.bullets));
+        prof.count("active_enemies", sum(1 for en in self.enemies if en.active));
+        prof.count("collision_tests", self.wall_grid.tests + self.enemy_hash.tests);
+        prof.count("blits", self.renderer.drawn);
+        prof.count("culled", self.renderer.culled);
+        if self.renderer.threaded:
+            prof.count("render_waits", self.renderer.waits);
+        prof.count("camera_allocs", self.camera.allocations);
+        self.camera.allocations = 0;
+        if self.scheduler:
+            for name, value in self.scheduler.stats().items():
+                prof.count(name, value);
+        if self.world:
+            prof.count("chunks_resident", len(self.world.resident));
+            prof.count("chunks_over_budget", self.world.over_budget);
+        self.wall_grid.tests = self.enemy_hash.tests = 0;
+        prof.end();
+
+    def run(self, scene, title="game", record=None):
+        """ runs the game! pass a file name as record to save the input for Replay """
+        self.setup(scene, title);
+        if record:
+            self.recorder = Recorder(record, self.rng_seed, scene, settings(self));
+        elif not self.history and not self.world:
+            self.enable_rewind(); # backspace goes back 3 seconds, F5 restarts the scene
+
+        # the simulation runs in fixed ticks, as many as the time that passed calls for,
+        # and every frame is drawn between the last two ticks; a slow frame costs frames, not speed
+        tick = 1 / self.tick_rate;
+        lag = 0.0;
+        last = time.perf_counter();
 
         try:
 
             while self.running:
 
-                mouse_pos = pygame.mouse.get_pos();
+                now = time.perf_counter();
+                lag = min(lag + now - last, MAX_STEPS * tick);
+                last = now;
 
-                for event in pygame.event.get():
-
-                    if event.type == pygame.QUIT:
-                        self.running = False;
-                        break;
-
-                    elif event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_ESCAPE:
-                            self.running = False;
-                            break;
-                        elif event.key == pygame.K_UP:
-                            self.player.moving = True;
-                        elif event.key == pygame.K_SPACE:
-                            self.player.shooting = True
-
-                    elif event.type == pygame.KEYUP:
-                        if event.key == pygame.K_UP:
-                            self.player.moving = False
-                        elif event.key == pygame.K_SPACE:
-                            self.player.shooting = False;
-
-                self.player.update(self.walls, self.camera.reverse(mouse_pos), self.enemies);
-                self.enemies.update(self.walls, self.player);
-                self.entities.update(self.player);
-                self.camera.update(self.player);
-                
-                self.player.shoot(self.camera.reverse(mouse_pos), self.bullet_image);
-
-                self.window.blit(self.background_image, self.camera.apply_pos((0, 0)));
-                for spr in self.entities:
-                    self.window.blit(spr.image, self.camera.apply(spr));
-                for en in self.enemies:
-                    self.window.blit(en.image, self.camera.apply(en));
-                for bul in self.player.bullets:
-                    self.window.blit(bul.image, self.camera.apply(bul));
-                self.window.blit(self.player.image, self.camera.apply(self.player));
-
-                self.window.blit(self.cursor_image, (mouse_pos[0]-5, mouse_pos[1]-5));
-                pygame.display.flip();
+                mouse_pos = pygame.mouse.get_pos();
+                self.handle_events();
+                while lag >= tick and self.running:
+                    if self.recorder: self.recorder.record(self, mouse_pos);
+                    self.step(mouse_pos);
+                    lag -= tick;
+                self.render(mouse_pos, lag / tick);
+                self.end_frame();
 
                 self.clock.tick(self.fps);
 
@@ -175,7 +387,92 @@ class Environment():
 
         self.end_game();
 
+    def simulate(self, scene, ticks, controller=None, render=False):
+        """ runs the game for a number of ticks as fast as possible and returns the player's stats
+
+        controller is called as controller(env, tick) and returns (mouse_pos, moving, shooting),
+        with mouse_pos in screen coordinates. Without one the player stands still.
+        """
+        self.setup(scene);
+        mouse_pos = (WIN_WIDTH // 2, WIN_HEIGHT // 2);
+        tick = 0;
+
+        while self.running and tick < ticks:
+            if controller is not None:
+                mouse_pos, self.player.moving, self.player.shooting = controller(self, tick);
+            if not self.headless:
+                pygame.event.pump();
+            self.step(mouse_pos);
+            if render:
+                self.render(mouse_pos);
+            self.end_frame();
+            tick += 1;
+        if render: self.renderer.finish();
+
+        result = self.result or self.stats();
+        result["ticks"] = tick;
+        result["finished"] = self.result is not None;
+        self.running = False;
+        return result;
+
+
+def seed(text):
+    """ argparse type for --seed, it has to fit in a recording """
+    value = int(text);
+    if not 0 <= value < 1 << 32:
+        raise argparse.ArgumentTypeError("has to be from 0 to {}".format((1 << 32) - 1));
+    return value;
+
+
+def smoothing(text):
+    """ argparse type for --smooth-camera """
+    value = float(text);
+    if not 0 <= value < 1:
+        raise argparse.ArgumentTypeError("has to be at least 0 and under 1");
+    return value;
+
 
 if __name__ == "__main__":
-    env = Environment();
-    env.run("scenes/scene3.txt");
+    parser = argparse.ArgumentParser(description="top down game");
+    parser.add_argument("scene", nargs="?", default="scenes/scene3.txt");
+    parser.add_argument("--seed", type=seed, help="seed for the bananas' speeds");
+    parser.add_argument("--record", metavar="FILE", help="save the input to FILE so it can be replayed");
+    parser.add_argument("--replay", metavar="FILE", help="play back a recording instead of reading input");
+    parser.add_argument("--headless", action="store_true", help="replay without a window, as fast as possible");
+    parser.add_argument("--profile", action="store_true", help="show frame timings on screen");
+    parser.add_argument("--trace", metavar="FILE", help="write per-frame timings to a CSV file");
+    parser.add_argument("--numpy-enemies", action="store_true", help="move the bananas in batches with numpy");
+    parser.add_argument("--no-pathfinding", action="store_true", help="bananas head straight for the player");
+    parser.add_argument("--stream", action="store_true", help="load the scene in chunks around the camera");
+    parser.add_argument("--chunk-budget", type=int, default=64, help="most chunks kept in memory with --stream");
+    parser.add_argument("--lod", action="store_true", help="update bananas far off screen less often");
+    parser.add_argument("--lod-budget", type=int, help="most far away banana updates per tick with --lod");
+    parser.add_argument("--dirty-rects", action="store_true", help="only redraw what changed while the camera holds still");
+    parser.add_argument("--fps", type=int, default=60, help="frames drawn per second (0 = no limit), "
+                        "the game itself always runs at {} ticks per second".format(TICK_RATE));
+    parser.add_argument("--pipelined", action="store_true", help="blit and flip on a separate render thread");
+    parser.add_argument("--smooth-camera", type=smoothing, default=0.0, metavar="F",
+                        help="let the camera lag behind the player, 0 (off) to just under 1 (very lazy)");
+    args = parser.parse_args();
+    if args.headless and not args.replay:
+        parser.error("--headless needs --replay, there's no input to play without a window");
+
+    env = Environment(args.headless, args.seed);
+    if args.numpy_enemies:
+        env.enemy_engine = "numpy";
+    env.pathfinding = not args.no_pathfinding;
+    env.fps = args.fps;
+    env.streaming, env.chunk_budget = args.stream, args.chunk_budget;
+    env.lod, env.lod_budget = args.lod, args.lod_budget;
+    env.dirty_rects = args.dirty_rects;
+    env.camera_smoothing = args.smooth_camera;
+    env.pipelined = args.pipelined;
+    if args.profile or args.trace:
+        env.enable_profiling(args.profile, args.trace);
+    if args.replay:
+        start = time.perf_counter();
+        result = Replayer.load(args.replay).replay(env, render=not args.headless);
+        result["seconds"] = round(time.perf_counter() - start, 3);
+        print(result);
+    else:
+        env.run(args.scene, record=args.record);